@@ -0,0 +1,128 @@
+"""
+Benchmark of the WSGI and ASGI entry points under concurrent load
+
+Starts the service as a single gunicorn sync worker, as a single
+gunicorn gthread worker and as a single uvicorn worker running
+service.asgi:app, then sends the same GET requests from many concurrent
+clients to each and prints the throughput and latency percentiles side
+by side.
+
+Usage:
+    python -m benchmarks.asgi_vs_wsgi --rows 2000 --concurrency 200 --requests 4000
+
+The database comes from DATABASE_URI and defaults to a SQLite file,
+because both servers must share it. The product table is emptied before
+seeding. The gap between the servers grows with the database round trip
+time, so run it against Postgres over the network for realistic numbers.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("DATABASE_URI", "sqlite:////tmp/benchmark.db")
+
+# pylint: disable=wrong-import-position
+from service import app  # noqa: E402
+from service.models import Product  # noqa: E402
+from tests.factories import ProductFactory  # noqa: E402
+
+# -c /dev/null keeps gunicorn.conf.py out: its max_requests would recycle
+# the worker mid-run, which uvicorn never does
+GUNICORN = ["gunicorn", "-c", "/dev/null", "--workers", "1", "--log-level", "warning"]
+SERVERS = {
+    "sync": GUNICORN + ["--worker-class", "sync", "service:app"],
+    "gthread": GUNICORN + ["--worker-class", "gthread", "--threads", "8", "service:app"],
+    "asgi": ["uvicorn", "--workers", "1", "--log-level", "warning", "service.asgi:app"],
+}
+
+
+def free_port() -> int:
+    """Returns a TCP port nothing is listening on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(name: str, port: int) -> subprocess.Popen:
+    """Starts one of the SERVERS on port and waits until it accepts connections"""
+    bind = ["--bind", f"127.0.0.1:{port}"] if name != "asgi" else ["--host", "127.0.0.1", "--port", str(port)]
+    process = subprocess.Popen(SERVERS[name] + bind, env=os.environ.copy())  # pylint: disable=consider-using-with
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    sys.exit(f"{name} server did not start")
+
+
+async def fetch(port: int, path: str) -> float:
+    """Sends one GET on a new connection and returns its latency in seconds"""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    if b" 200 " not in status_line:
+        raise RuntimeError(f"GET {path} answered {status_line!r}")
+    return time.perf_counter() - start
+
+
+async def load(port: int, path: str, concurrency: int, requests: int) -> tuple:
+    """Sends requests GETs from concurrency clients and returns (seconds, latencies)"""
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def client():
+        for _ in remaining:
+            latencies.append(await fetch(port, path))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+def percentile(latencies: list, pct: int) -> float:
+    """Returns a latency percentile in milliseconds"""
+    return statistics.quantiles(latencies, n=100)[pct - 1] * 1000
+
+
+def main():
+    """Seeds the catalog, loads both servers and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2000, help="number of Products to seed")
+    parser.add_argument("--concurrency", type=int, default=200, help="number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=4000, help="number of requests per server")
+    parser.add_argument("--path", default="/api/products?limit=20&sort=price", help="the URL to GET")
+    args = parser.parse_args()
+
+    Product.delete_where()
+    Product.bulk_create([ProductFactory() for _ in range(args.rows)])
+
+    print(f"GET {args.path}: {args.requests} requests from {args.concurrency} clients")
+    print(f"{'server':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name in SERVERS:
+        port = free_port()
+        process = start_server(name, port)
+        try:
+            asyncio.run(load(port, args.path, args.concurrency, 50))  # warm up
+            elapsed, latencies = asyncio.run(load(port, args.path, args.concurrency, args.requests))
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"{name:<8}{len(latencies) / elapsed:>10.0f}"
+              f"{percentile(latencies, 50):>10.1f}{percentile(latencies, 99):>10.1f}")
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        main()
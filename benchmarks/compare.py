@@ -0,0 +1,66 @@
+"""
+Compares two JSON reports of benchmarks.suite
+
+Prints the change in throughput and p50/p99 latency of every operation
+measured in both reports, and exits with status 1 when any of them got
+slower than the threshold allows, so it can gate a CI job.
+
+Usage:
+    python -m benchmarks.compare benchmarks/results/<base>.json benchmarks/results/<head>.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> tuple:
+    """Returns a report and its results keyed by (size, operation)"""
+    with open(path, encoding="utf-8") as file:
+        report = json.load(file)
+    return report, {(result["size"], result["operation"]): result for result in report["results"]}
+
+
+def change(base: float, head: float) -> float:
+    """Returns the relative change from base to head in percent"""
+    return (head - base) / base * 100 if base else 0.0
+
+
+def compare(base: dict, head: dict, threshold: float) -> list:
+    """Returns (size, operation, throughput %, p50 %, p99 %, regressed) for every shared result"""
+    rows = []
+    for key in sorted(base.keys() & head.keys()):
+        old, new = base[key], head[key]
+        throughput = change(old["ops_per_sec"], new["ops_per_sec"])
+        p50 = change(old["p50_ms"], new["p50_ms"])
+        p99 = change(old["p99_ms"], new["p99_ms"])
+        regressed = throughput < -threshold or p50 > threshold
+        rows.append((*key, throughput, p50, p99, regressed))
+    return rows
+
+
+def main():
+    """Prints the comparison and exits 1 on a regression"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("base", help="report of the reference commit")
+    parser.add_argument("head", help="report of the commit under test")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="largest tolerated throughput drop or p50 increase, in percent")
+    args = parser.parse_args()
+
+    base_report, base = load(args.base)
+    head_report, head = load(args.head)
+    if base_report["database"] != head_report["database"]:
+        sys.exit(f"Cannot compare {base_report['database']} results with {head_report['database']} results")
+
+    print(f"{base_report['commit'][:12]} -> {head_report['commit'][:12]} on {head_report['database']}")
+    print(f"{'size':>9}  {'operation':<22}{'ops/s':>10}{'p50':>10}{'p99':>10}")
+    rows = compare(base, head, args.threshold)
+    for size, operation, throughput, p50, p99, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{size:>9}  {operation:<22}{throughput:>+9.1f}%{p50:>+9.1f}%{p99:>+9.1f}%{flag}")
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark for the list serialization paths of GET /products
+
+Compares the ORM path the list endpoint used to take (Product instances,
+then Product.serialize(), then marshalling with product_model) with the
+lean path of Product.search_rows(), which selects column tuples and
+serializes them with Product.serialize_row().
+
+Usage:
+    python -m benchmarks.list_serialization --rows 20000 --repeat 5
+
+The database comes from DATABASE_URI and defaults to in-memory SQLite.
+The product table is emptied before seeding.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+
+# pylint: disable=wrong-import-position
+from service import api, app  # noqa: E402
+from service.models import Product, db  # noqa: E402
+from service.routes import product_model  # noqa: E402
+from tests.factories import ProductFactory  # noqa: E402
+
+
+def orm_path():
+    """Serializes the catalog the way ProductCollection.get used to"""
+    results = [product.serialize() for product in Product.search()]
+    return api.marshal(results, product_model)
+
+
+def lean_path():
+    """Serializes the catalog the way ProductCollection.get does now"""
+    return Product.search_rows()
+
+
+def best_of(func, repeat: int) -> float:
+    """Returns the fastest of repeat runs of func in seconds"""
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    """Seeds the catalog and prints the rows/sec of both paths"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20000, help="number of Products to seed")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs per path")
+    args = parser.parse_args()
+
+    Product.delete_where()
+    Product.bulk_create([ProductFactory() for _ in range(args.rows)])
+
+    orm = best_of(orm_path, args.repeat)
+    lean = best_of(lean_path, args.repeat)
+    print(f"rows: {args.rows}")
+    print(f"{'orm + serialize + marshal':<32}{args.rows / orm:>12,.0f} rows/sec")
+    print(f"{'column tuples + serialize_row':<32}{args.rows / lean:>12,.0f} rows/sec")
+    print(f"speedup: {orm / lean:.1f}x")
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        main()
@@ -0,0 +1,145 @@
+"""
+Gunicorn configuration for the Product service
+
+Gunicorn loads this file from the working directory. Every setting can
+be overridden with an environment variable, and command line flags (as
+used in the Procfile) still take precedence over both.
+
+Workers and threads are sized from the CPUs the container may actually
+use (its cgroup quota and CPU affinity), not the CPU count of the host.
+"""
+import glob
+import math
+import os
+import sys
+import tempfile
+
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+def _read(path: str) -> str:
+    """Returns the stripped contents of a file, or None if it cannot be read"""
+    try:
+        with open(path, encoding="utf-8") as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit() -> float:
+    """Returns the number of CPUs allowed by the cgroup quota, or None if unlimited"""
+    cpu_max = _read(CGROUP_V2_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max":
+            return int(quota) / int(period or 100000)
+        return None
+    quota, period = _read(CGROUP_V1_QUOTA), _read(CGROUP_V1_PERIOD)
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def available_cpus() -> int:
+    """Returns the number of CPUs this process can use, at least 1"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(cpus, 1)
+
+
+def env_bool(name: str, default: str) -> bool:
+    """Returns a true/false environment variable"""
+    return os.getenv(name, default).lower() in ("true", "1", "yes")
+
+
+CPUS = available_cpus()
+
+# Server socket
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8080')}")
+backlog = int(os.getenv("GUNICORN_BACKLOG", "2048"))
+
+# Worker processes: gthread workers serve several requests each while
+# they wait on the database; GUNICORN_THREADS=1 falls back to sync workers
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread" if threads > 1 else "sync")
+workers = int(os.getenv("GUNICORN_WORKERS", str(2 * CPUS + 1)))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+# keep idle connections from the load balancer open a little longer than its probes
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Recycle workers after a jittered number of requests so they do not all
+# restart at once and slow leaks are bounded
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", str(max_requests // 10)))
+
+# Import the app once in the master so workers share its code copy-on-write
+preload_app = env_bool("GUNICORN_PRELOAD", "true")
+
+# Heartbeat files on tmpfs, so a slow container disk cannot stall workers
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+# Prometheus samples of all workers are written to one directory and
+# merged by /metrics. Samples of a previous run must be gone before a
+# preloaded app records anything, so its *.db files are removed as soon
+# as this file is loaded; anything else in the directory is left alone.
+PROMETHEUS_DIR = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "products-prometheus")
+)
+os.makedirs(PROMETHEUS_DIR, exist_ok=True)
+for sample_file in glob.glob(os.path.join(PROMETHEUS_DIR, "*.db")):
+    os.remove(sample_file)
+
+# Logging
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+
+
+######################################################################
+# Server hooks
+######################################################################
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Drops the database connections a preloaded master opened before forking"""
+    if not preload_app:
+        return
+    # pylint: disable=import-outside-toplevel
+    from service import app
+    from service.models import db
+    from service.common.pool_metrics import pool_metrics
+
+    with app.app_context():
+        # close=False leaves the sockets to the master instead of closing them under it
+        db.engine.dispose(close=False)
+    pool_metrics.reset()
+
+
+def worker_exit(server, worker):  # pylint: disable=unused-argument
+    """Writes any buffered likes before the worker goes away"""
+    routes = sys.modules.get("service.routes")
+    if routes is not None:
+        routes.like_buffer.stop()
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the live-only samples of a worker that went away"""
+    # pylint: disable=import-outside-toplevel
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def when_ready(server):
+    """Logs the worker model once the master is ready"""
+    server.log.info(
+        "Serving with %s %s workers x %s threads on %s CPUs (max_requests %s +/- %s)",
+        workers, worker_class, threads, CPUS, max_requests, max_requests_jitter,
+    )
@@ -8,7 +8,7 @@ import sys
 from flask import Flask
 from flask_restx import Api
 from service import config
-from service.common import log_handlers
+from service.common import log_handlers, metrics, profiling
 
 # Create Flask application
 app = Flask(__name__)
@@ -36,6 +36,8 @@ from service.common import error_handlers, cli_commands  # noqa: F401, E402
 
 # Set up logging for production
 log_handlers.init_logging(app, "gunicorn.error")
+metrics.init_metrics(app)
+profiling.init_profiling(app)
 
 app.logger.info(70 * "*")
 app.logger.info("  S E R V I C E   R U N N I N G  ".center(70, "*"))
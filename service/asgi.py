@@ -0,0 +1,198 @@
+"""
+ASGI entry point for the Product API
+
+The hot read paths, GET /api/products and GET /api/products/<id>, are
+served on the event loop with asynchronous database access (asyncpg for
+Postgres, aiosqlite for SQLite), so one process keeps hundreds of
+requests in flight while they wait on the database. They reuse the
+argument parsers, query builders and marshalling of service.routes, so
+the responses are the same as the Flask app's.
+
+Every other request, and any read that does not pass validation or
+asks for something the async path does not serve (NDJSON streams, a
+missing Product), is handed to the Flask app through asgiref's WSGI
+adapter, which runs it in a thread pool with the usual error handling.
+
+Run with:
+    uvicorn service.asgi:app --host 0.0.0.0 --port 8080
+"""
+import logging
+import re
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import quote_etag
+from service import app as flask_app
+from service import routes
+from service.models import Product, DataValidationError, product_cache
+
+logger = logging.getLogger("flask.app")
+
+# async drivers for the database URI schemes the service supports
+ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+_engine = None
+
+
+def async_database_uri(uri: str) -> str:
+    """Returns the database URI rewritten to use an asyncio driver"""
+    scheme, separator, rest = uri.partition("://")
+    if scheme not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for database URI scheme: {scheme}")
+    return ASYNC_DRIVERS[scheme] + separator + rest
+
+
+def get_engine():
+    """Returns the async engine, creating it on first use
+
+    The pool is sized with the same SQLALCHEMY_ENGINE_OPTIONS as the
+    synchronous engine. In-memory SQLite cannot be shared between
+    engines, so the async path needs a file or server database.
+    """
+    global _engine  # pylint: disable=global-statement
+    if _engine is None:
+        options = dict(flask_app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+        options.pop("poolclass", None)
+        if "pool_size" in options:
+            options["poolclass"] = AsyncAdaptedQueuePool
+        _engine = create_async_engine(async_database_uri(flask_app.config["SQLALCHEMY_DATABASE_URI"]), **options)
+    return _engine
+
+
+async def dispose_engine():
+    """Closes every pooled connection of the async engine"""
+    global _engine  # pylint: disable=global-statement
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+
+
+######################################################################
+# ASYNC HANDLERS
+######################################################################
+async def list_products(request):
+    """Returns all of the Products, like ProductCollection.get"""
+    logger.info("Request to list Products...")
+    args = routes.product_args.parse_args()
+    if request.accept_mimetypes.best_match(['application/json', routes.NDJSON_MIMETYPE]) == routes.NDJSON_MIMETYPE:
+        return None
+
+    params = routes.page_params(args) if routes.is_paged(args) else None
+    async with get_engine().connect() as conn:
+        if request.if_none_match:
+            query, _ = routes.list_query(args, params, routes.VERSION_FIELDS)
+            etag = routes.list_etag(args, await conn.execute(query.statement))
+            if etag in request.if_none_match:
+                logger.info("Product list not modified")
+                return routes.not_modified(etag)
+
+        query, fields = routes.list_query(args, params)
+        result = await conn.execute(query.statement)
+        products = [Product.serialize_row(row, fields) for row in result]
+    body, headers = routes.list_response(args, params, products)
+    return routes.api.make_response(body, 200, headers)
+
+
+async def get_product(request, product_id: str):
+    """Returns a single Product, like ProductResource.get"""
+    logger.info("Request for product with id: %s", product_id)
+    fields = routes.parse_fields(routes.fields_args.parse_args()['fields'])
+    product = product_cache.get(int(product_id))
+    if product is None:
+        query = Product.rows_query().filter(Product.id == int(product_id))
+        async with get_engine().connect() as conn:
+            row = (await conn.execute(query.statement)).first()
+        if row is None:
+            return None
+        product = Product.serialize_row(row)
+        product_cache.put(product["id"], product)
+
+    etag = routes.product_etag(product["id"], product["version"], fields)
+    if etag in request.if_none_match:
+        logger.info("Product with id [%s] not modified", product_id)
+        return routes.not_modified(etag)
+    body = routes.api.marshal(product, routes.product_model, mask=routes.fields_mask(fields))
+    return routes.api.make_response(body, 200, {"ETag": quote_etag(etag)})
+
+
+ASYNC_ROUTES = (
+    (re.compile(r"^/api/products/?$"), list_products),
+    (re.compile(r"^/api/products/(\d+)/?$"), get_product),
+)
+
+
+######################################################################
+# ASGI APPLICATION
+######################################################################
+async def app(scope, receive, send):
+    """Routes hot reads to the async handlers and everything else to Flask"""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] == "http" and scope["method"] == "GET":
+        for pattern, handler in ASYNC_ROUTES:
+            match = pattern.match(scope["path"])
+            if match and await serve(handler, match.groups(), scope, send):
+                return
+    await wsgi_app(scope, receive, send)
+
+
+async def serve(handler, params: tuple, scope, send) -> bool:
+    """Runs an async handler inside a Flask request context
+
+    Returns False without sending anything when the request should be
+    served by the Flask app instead.
+    """
+    with request_context(scope) as context:
+        try:
+            response = flask_app.preprocess_request()
+            if response is None:
+                response = await handler(context.request, *params)
+                if response is None:
+                    return False
+            response = flask_app.process_response(flask_app.make_response(response))
+        except (HTTPException, DataValidationError):
+            # let the Flask app produce its usual error response
+            return False
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": [(key.lower().encode("latin-1"), value.encode("latin-1"))
+                        for key, value in response.headers.items()],
+        })
+        await send({"type": "http.response.body", "body": response.get_data()})
+    return True
+
+
+def request_context(scope):
+    """Returns a Flask request context for the request described by an ASGI scope"""
+    headers = [(key.decode("latin-1"), value.decode("latin-1")) for key, value in scope["headers"]]
+    host = dict((key.lower(), value) for key, value in headers).get("host")
+    if host is None and scope.get("server"):
+        host = "%s:%s" % tuple(scope["server"])
+    base_url = f"{scope.get('scheme', 'http')}://{host or 'localhost'}{scope.get('root_path', '')}"
+    # the builder only assembles a WSGI environ, no test client is involved
+    return flask_app.test_request_context(
+        scope["path"], base_url=base_url, query_string=scope["query_string"], headers=headers,
+    )
+
+
+async def lifespan(receive, send):
+    """Handles the ASGI lifespan protocol: drain likes and close the pool on shutdown"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            routes.like_buffer.stop()
+            await dispose_engine()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -0,0 +1,128 @@
+"""
+Bulk SQL
+
+This module holds the database plumbing of Product.bulk_load() and
+Product.bulk_upsert(): COPY FROM STDIN on Postgres, one executemany
+INSERT on SQLite, and the temporary staging table merged into the
+target with INSERT ... ON CONFLICT (id) DO UPDATE. The functions work on
+whatever table they are given and run on the connection of the caller's
+transaction; the model, its full-text index and its caches stay in
+service.models.
+"""
+import csv
+import io
+
+from sqlalchemy import Date, column, func, literal, select, table, text, true
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def begin_immediate(connection):
+    """Begins a SQLite transaction holding the write lock, unless one is open
+
+    pysqlite only begins a transaction before DML, so DDL would otherwise
+    be committed on its own and another writer could get in between.
+    """
+    if not connection.connection.driver_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def copy_rows(connection, table_name: str, fields: list, rows: list):
+    """Streams rows into a Postgres table with COPY FROM STDIN as CSV"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)  # None becomes an unquoted empty field, read back as NULL
+    buffer.seek(0)
+    quote = connection.dialect.identifier_preparer.quote
+    columns = ", ".join(quote(field) for field in fields)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {quote(table_name)} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def insert_rows(connection, target_table, fields: list, rows: list):
+    """Inserts rows into a SQLite table with one executemany straight through the driver"""
+    quote = connection.dialect.identifier_preparer.quote
+    columns = ", ".join(quote(field) for field in fields)
+    placeholders = ", ".join("?" * len(fields))
+    # the driver gets the tuples as they are, so store dates the way the Date type does
+    rows = isoformat_dates(target_table, fields, rows)
+    connection.exec_driver_sql(f"INSERT INTO {quote(target_table.name)} ({columns}) VALUES ({placeholders})", rows)
+
+
+def isoformat_dates(target_table, fields: list, rows: list) -> list:
+    """Returns rows with the values of the Date columns of target_table as ISO strings"""
+    indexes = [index for index, field in enumerate(fields) if isinstance(target_table.c[field].type, Date)]
+    if not indexes:
+        return rows
+    converted = []
+    for row in rows:
+        row = list(row)
+        for index in indexes:
+            if row[index] is not None:
+                row[index] = row[index].isoformat()
+        converted.append(tuple(row))
+    return converted
+
+
+def stage_rows(connection, source_table, table_name: str, fields: list, rows: list):
+    """Copies rows into a new temporary table with the source_table columns in fields and returns it"""
+    quote = connection.dialect.identifier_preparer.quote
+    columns = ", ".join(quote(field) for field in fields)
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {quote(table_name)}")
+    # CREATE TABLE AS keeps the column types but none of the constraints
+    connection.exec_driver_sql(
+        f"CREATE TEMPORARY TABLE {quote(table_name)} AS SELECT {columns} FROM {quote(source_table.name)} LIMIT 0"
+    )
+    staging = table(table_name, *(column(field) for field in fields))
+    if connection.dialect.name == "postgresql":
+        copy_rows(connection, table_name, fields, rows)
+    else:
+        rows = isoformat_dates(source_table, fields, rows)
+        connection.execute(staging.insert(), [dict(zip(fields, row)) for row in rows])
+    return staging
+
+
+def last_id(connection, target_table) -> int:
+    """Returns the highest id ever given to a row of target_table, deleted or not"""
+    if connection.dialect.name == "postgresql":
+        statement = text("SELECT pg_sequence_last_value(pg_get_serial_sequence(:name, 'id')::regclass)")
+    elif connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").first():
+        statement = text("SELECT max(seq) FROM sqlite_sequence WHERE name = :name")
+    else:
+        statement = text("SELECT NULL")  # a table created before ids became AUTOINCREMENT
+    highest = connection.execute(statement, {"name": target_table.name}).scalar() or 0
+    return max(highest, connection.execute(select(func.max(target_table.c.id))).scalar() or 0)
+
+
+def advance_sequence(connection, target_table):
+    """Moves the Postgres id sequence of target_table past its highest id, never back
+
+    Explicit ids bypass the sequence, so it lags behind after a merge.
+    """
+    quote = connection.dialect.identifier_preparer.quote
+    connection.execute(
+        text(
+            f"SELECT setval(pg_get_serial_sequence(:name, 'id'), greatest((SELECT max(id) FROM {quote(target_table.name)}), "
+            "pg_sequence_last_value(pg_get_serial_sequence(:name, 'id')::regclass)))"
+        ),
+        {"name": target_table.name},
+    )
+
+
+def merge_statement(dialect: str, target_table, staging, fields: list):
+    """Returns the INSERT ... ON CONFLICT (id) DO UPDATE of the staged rows into target_table"""
+    values = [field for field in fields if field not in ("id", "version")]
+    if dialect == "postgresql":
+        new_id = func.coalesce(staging.c.id, func.nextval(func.pg_get_serial_sequence(target_table.name, "id")))
+        insert = postgresql.insert
+    else:
+        new_id = staging.c.id  # SQLite assigns the next rowid to a NULL id
+        insert = sqlite.insert
+    # WHERE true tells SQLite the ON CONFLICT belongs to the INSERT, not a join
+    rows = select(new_id, *(staging.c[field] for field in values), literal(1)).where(true())
+    statement = insert(target_table).from_select(["id", *values, "version"], rows)
+    return statement.on_conflict_do_update(
+        index_elements=[target_table.c.id],
+        set_=dict({field: statement.excluded[field] for field in values}, version=target_table.c.version + 1),
+    )
@@ -0,0 +1,150 @@
+"""
+Catalog Files
+
+This module writes the catalog to CSV, JSON Lines and Parquet files for
+flask products-export, and reads CSV and JSON Lines feeds for flask
+products-import. Every writer takes the chunks of column tuples of
+Product.stream_chunks() and writes each chunk as soon as it arrives, so
+memory stays flat whatever the size of the catalog. The readers validate
+one record at a time and report the rejected ones instead of failing.
+
+pyarrow is only imported for Parquet, it is too heavy to load in every
+worker of the service.
+"""
+import csv
+import json
+from datetime import date
+
+from service.models import ROW_FIELDS, DataValidationError, Product
+
+FORMATS = ("csv", "jsonl", "parquet")
+BINARY_FORMATS = ("parquet",)
+IMPORT_FORMATS = ("csv", "jsonl")
+
+# columns of the rows read for Product.bulk_upsert(), which sets the version
+IMPORT_FIELDS = tuple(field for field in ROW_FIELDS if field != "version")
+
+
+def write_csv(chunks, file, fields=ROW_FIELDS) -> int:
+    """Writes a header and the rows as CSV, returning the number of rows
+
+    Dates are written in ISO format and NULLs as empty fields.
+    """
+    writer = csv.writer(file)
+    writer.writerow(fields)
+    count = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def write_jsonl(chunks, file, fields=ROW_FIELDS) -> int:
+    """Writes one serialized Product per line, returning the number of rows"""
+    count = 0
+    for rows in chunks:
+        file.write("".join(json.dumps(Product.serialize_row(row, fields)) + "\n" for row in rows))
+        count += len(rows)
+    return count
+
+
+def write_parquet(chunks, file, fields=ROW_FIELDS) -> int:
+    """Writes the rows as Parquet with one row group per chunk, returning the number of rows"""
+    import pyarrow as pa  # pylint: disable=import-outside-toplevel
+    import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+    schema = parquet_schema(pa, fields)
+    count = 0
+    with pq.ParquetWriter(file, schema) as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            count += len(rows)
+    return count
+
+
+def parquet_schema(pa, fields):
+    """Returns the Arrow schema of the Product columns in fields"""
+    types = {int: pa.int64(), float: pa.float64(), str: pa.string(), date: pa.date32()}
+    columns = Product.__table__.c
+    return pa.schema([(field, types[columns[field].type.python_type]) for field in fields])
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "parquet": write_parquet}
+
+
+def read_products(file, file_format: str):
+    """Yields (line number, row, error) for every record of a CSV or JSON Lines file
+
+    Valid records come with their row in IMPORT_FIELDS order and no
+    error, rejected ones with no row and the reason.
+    """
+    records = read_csv(file) if file_format == "csv" else read_jsonl(file)
+    for number, data in records:
+        try:
+            yield number, to_row(data), None
+        except DataValidationError as error:
+            yield number, None, str(error)
+
+
+def read_csv(file):
+    """Yields (line number, Product dict) for every CSV record
+
+    Numeric columns are converted to numbers where possible and empty
+    fields to None, so the dict validates like a JSON one.
+    """
+    columns = Product.__table__.c
+    reader = csv.DictReader(file)
+    for data in reader:
+        for field, value in data.items():
+            if value == "":
+                data[field] = None
+            elif field in columns and columns[field].type.python_type in (int, float):
+                try:
+                    data[field] = columns[field].type.python_type(value)
+                except (TypeError, ValueError):
+                    pass  # left as text, so validation rejects it
+        yield reader.line_num, data
+
+
+def read_jsonl(file):
+    """Yields (line number, Product dict) for every non-blank line, or the line itself if it is no JSON"""
+    for number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, line
+
+
+def to_row(data) -> tuple:
+    """Validates a Product dict and returns its values in IMPORT_FIELDS order
+
+    Applies the rules of Product.deserialize, then checks every value
+    against its column so that a bad record cannot fail a whole batch.
+    """
+    if not isinstance(data, dict):
+        raise DataValidationError("Invalid product: not a JSON object")
+    product = Product().deserialize(data)
+    product.id = data.get("id")
+    columns = Product.__table__.c
+    row = tuple(getattr(product, field) for field in IMPORT_FIELDS)
+    for field, value in zip(IMPORT_FIELDS, row):
+        check_value(columns[field], value)
+    return row
+
+
+def check_value(column, value):
+    """Raises DataValidationError if value cannot be stored in column"""
+    if value is None:
+        if not column.nullable and not column.primary_key:
+            raise DataValidationError(f"Invalid product: {column.name} is required")
+        return
+    python_type = column.type.python_type
+    if python_type is float and isinstance(value, int):
+        python_type = int
+    if not isinstance(value, python_type) or isinstance(value, bool):
+        raise DataValidationError(f"Invalid type for {python_type.__name__} [{column.name}]: {type(value)}")
+    if python_type is str and column.type.length and len(value) > column.type.length:
+        raise DataValidationError(f"Invalid product: {column.name} is longer than {column.type.length} characters")
@@ -1,8 +1,14 @@
 """
 Flask CLI Command Extensions
 """
+import os
+import time
+
+import click
+from sqlalchemy.exc import SQLAlchemyError
 from service import app
-from service.models import db
+from service.common import catalog_io, synthetic
+from service.models import Product, db
 
 
 ######################################################################
@@ -19,3 +25,110 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+
+
+######################################################################
+# Command to load a large synthetic catalog
+# Usage:
+#   flask db-seed --count 1000000 --categories 15 --seed 42
+######################################################################
+@app.cli.command("db-seed")
+@click.option("--count", default=10000, show_default=True, type=click.IntRange(min=1),
+              help="Number of products to add.")
+@click.option("--categories", default=len(synthetic.CATEGORIES), show_default=True, type=click.IntRange(min=1),
+              help="Number of distinct categories.")
+@click.option("--seed", default=0, show_default=True, type=int, help="Seed of the random generator.")
+@click.option("--batch-size", default=50000, show_default=True, type=click.IntRange(min=1),
+              help="Number of products loaded per transaction.")
+def db_seed(count, categories, seed, batch_size):
+    """
+    Adds synthetic products to the database with bulk loads, COPY on
+    Postgres and executemany elsewhere. The same seed gives the same
+    products.
+    """
+    start = time.perf_counter()
+    loaded = 0
+    for rows in synthetic.generate_batches(count, categories, seed, batch_size):
+        loaded += Product.bulk_load(synthetic.FIELDS, rows)
+        elapsed = time.perf_counter() - start
+        click.echo(f"{loaded}/{count} products loaded ({loaded / elapsed:,.0f} rows/s)")
+    click.echo(f"Seeded {loaded} products in {time.perf_counter() - start:.1f}s")
+
+
+######################################################################
+# Command to dump the catalog to a file
+# Usage:
+#   flask products-export --format parquet --output products.parquet
+######################################################################
+@app.cli.command("products-export")
+@click.option("--format", "file_format", type=click.Choice(catalog_io.FORMATS), default="csv", show_default=True,
+              help="Format of the export.")
+@click.option("--output", "-o", default="-", show_default=True, help="File to write, - for stdout.")
+@click.option("--chunk-size", default=10000, show_default=True, type=click.IntRange(min=1),
+              help="Number of products fetched per round trip.")
+def products_export(file_format, output, chunk_size):
+    """
+    Writes every product, sorted by id, with the columns of
+    Product.serialize. Rows are streamed from a server-side cursor so
+    memory use does not grow with the catalog.
+    """
+    start = time.perf_counter()
+    mode = "wb" if file_format in catalog_io.BINARY_FORMATS else "w"
+    with click.open_file(output, mode, encoding=None if "b" in mode else "utf-8") as file:
+        count = catalog_io.WRITERS[file_format](Product.stream_chunks(chunk_size), file)
+    click.echo(f"Exported {count} products in {time.perf_counter() - start:.1f}s", err=True)
+
+
+######################################################################
+# Command to load a supplier feed into the catalog
+# Usage:
+#   flask products-import feed.csv
+######################################################################
+@app.cli.command("products-import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option("--format", "file_format", type=click.Choice(catalog_io.IMPORT_FORMATS),
+              help="Format of the file, by default its extension.")
+@click.option("--batch-size", default=10000, show_default=True, type=click.IntRange(min=1),
+              help="Number of products merged per transaction.")
+def products_import(path, file_format, batch_size):
+    """
+    Inserts or updates, by id, the products of a CSV or JSON Lines file
+    with the columns of Product.serialize. Rows without an id are added.
+    Every row is validated like a POST and rejected rows are reported
+    without stopping the import.
+    """
+    file_format = file_format or os.path.splitext(path)[1].lstrip(".").lower()
+    if file_format not in catalog_io.IMPORT_FORMATS:
+        raise click.UsageError(f"Cannot tell the format of {path}, use --format")
+    start = time.perf_counter()
+    counts = {"inserted": 0, "updated": 0, "rejected": 0}
+
+    def merge(rows):
+        try:
+            inserted, updated = Product.bulk_upsert(catalog_io.IMPORT_FIELDS, rows)
+        except SQLAlchemyError as error:
+            counts["rejected"] += len(rows)
+            click.echo(f"Rejected a batch of {len(rows)} products: {error}", err=True)
+            return
+        counts["inserted"] += inserted
+        counts["updated"] += updated
+        click.echo(f"{counts['inserted'] + counts['updated']} products imported", err=True)
+
+    batch = []
+    with click.open_file(path, encoding="utf-8") as file:
+        for number, row, error in catalog_io.read_products(file, file_format):
+            if error is not None:
+                counts["rejected"] += 1
+                click.echo(f"Rejected line {number}: {error}", err=True)
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                merge(batch)
+                batch = []
+    if batch:
+        merge(batch)
+    click.echo(
+        f"Imported {counts['inserted']} new and {counts['updated']} updated products, "
+        f"rejected {counts['rejected']}, in {time.perf_counter() - start:.1f}s",
+        err=True,
+    )
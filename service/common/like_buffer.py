@@ -0,0 +1,93 @@
+"""
+Like Buffer
+
+This module contains an in-process write-behind accumulator that
+coalesces like increments per Product id and hands them to a flush
+function in batches, either every flush interval or as soon as the
+number of buffered increments reaches a limit
+"""
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger("flask.app")
+
+
+class LikeBuffer:
+    """Coalesces like increments in memory and flushes them in batches"""
+
+    def __init__(self, flush_func, interval: float, max_pending: int):
+        """
+        :param flush_func: called with a {product_id: count} dict to persist
+        :param interval: maximum number of seconds an increment stays buffered
+        :param max_pending: number of buffered increments that forces a flush
+        """
+        self.flush_func = flush_func
+        self.interval = interval
+        self.max_pending = max_pending
+        self._counts = Counter()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, product_id: int, n: int = 1) -> int:
+        """Buffers n likes for a Product and returns its buffered total"""
+        self.start()
+        with self._lock:
+            self._counts[product_id] += n
+            self._pending += n
+            buffered = self._counts[product_id]
+            full = self._pending >= self.max_pending
+        if full:
+            self.flush()
+        return buffered
+
+    def pending(self, product_id: int) -> int:
+        """Returns the number of likes buffered for a Product"""
+        with self._lock:
+            return self._counts.get(product_id, 0)
+
+    def flush(self) -> int:
+        """Writes every buffered increment and returns how many were written"""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, Counter()
+                total, self._pending = self._pending, 0
+            if not counts:
+                return 0
+            try:
+                self.flush_func(dict(counts))
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Could not flush %s buffered likes, will retry", total)
+                with self._lock:
+                    self._counts.update(counts)
+                    self._pending += total
+                return 0
+            logger.debug("Flushed %s likes for %s products", total, len(counts))
+            return total
+
+    def start(self):
+        """Starts the background flusher if it is not running"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="like-buffer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the background flusher and drains the buffer"""
+        self._stopped.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(self.interval + 1)
+        self.flush()
+
+    def _run(self):
+        """Flushes the buffer every interval until stopped"""
+        while not self._stopped.wait(self.interval):
+            self.flush()
@@ -0,0 +1,165 @@
+"""
+Prometheus Metrics
+
+This module contains the request and database metrics of the service
+and the hooks that record them. When PROMETHEUS_MULTIPROC_DIR is set
+(gunicorn.conf.py sets it for multi-worker servers) every worker writes
+its samples there and /metrics aggregates all of them.
+
+Each request also counts its own SQL statements and database time and
+reports them in a Server-Timing header, and statements slower than
+SLOW_QUERY_THRESHOLD_MS are written to the log as JSON.
+"""
+import json
+import logging
+import os
+import time
+from flask import g, has_request_context, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("flask.app")
+
+# set from the app config by init_metrics()
+settings = {"slow_query_seconds": 0.1, "server_timing": True}
+
+# longest parameter list kept in a slow query log entry
+MAX_LOGGED_PARAMETERS = 1000
+MAX_LOGGED_ROWS = 10
+
+# buckets in seconds, from a cache hit up to a slow full catalog listing
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUESTS = Counter(
+    "products_http_requests_total",
+    "HTTP requests by resource, method and status code",
+    ["resource", "method", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "products_http_request_duration_seconds",
+    "Time spent handling HTTP requests by resource and method",
+    ["resource", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    "products_http_request_db_queries",
+    "SQL statements executed per HTTP request by resource",
+    ["resource"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DB_QUERIES = Counter(
+    "products_db_queries_total",
+    "SQL statements executed by statement type",
+    ["statement"],
+)
+DB_QUERY_LATENCY = Histogram(
+    "products_db_query_duration_seconds",
+    "Time spent executing SQL statements by statement type",
+    ["statement"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+def init_metrics(app):
+    """Records the metrics of every request handled by app"""
+    settings.update(
+        slow_query_seconds=app.config.get("SLOW_QUERY_THRESHOLD_MS", 100) / 1000,
+        server_timing=app.config.get("SERVER_TIMING_ENABLED", True),
+    )
+    app.before_request(start_timer)
+    app.after_request(record_request)
+    app.logger.info("Metrics collection established")
+
+
+def start_timer():
+    """Remembers when the request started and resets its query counters"""
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+
+
+def record_request(response):
+    """Counts the request, observes its latency and adds the Server-Timing header
+
+    Streamed responses run their queries after this hook, so their
+    header only covers the work done before the first byte.
+    """
+    start = g.pop("request_start", None)
+    # flask-restx names endpoints after the Resource, i.e. product_resource
+    resource = request.endpoint or "unmatched"
+    REQUESTS.labels(resource, request.method, str(response.status_code)).inc()
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    REQUEST_LATENCY.labels(resource, request.method).observe(elapsed)
+    REQUEST_QUERIES.labels(resource).observe(g.db_queries)
+    if settings["server_timing"]:
+        response.headers.add("Server-Timing", server_timing(g.db_queries, g.db_seconds, elapsed))
+    return response
+
+
+def server_timing(queries: int, db_seconds: float, total_seconds: float) -> str:
+    """Returns the Server-Timing header value for a request"""
+    return (f'db;dur={db_seconds * 1000:.2f};desc="{queries} queries", '
+            f'app;dur={(total_seconds - db_seconds) * 1000:.2f}, total;dur={total_seconds * 1000:.2f}')
+
+
+def statement_type(statement: str) -> str:
+    """Returns the SQL verb of a statement, i.e. SELECT"""
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return verb if verb in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH") else "OTHER"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, *args):  # pylint: disable=unused-argument
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    verb = statement_type(statement)
+    DB_QUERIES.labels(verb).inc()
+    DB_QUERY_LATENCY.labels(verb).observe(elapsed)
+    if has_request_context() and "db_queries" in g:
+        g.db_queries += 1
+        g.db_seconds += elapsed
+    if elapsed >= settings["slow_query_seconds"]:
+        log_slow_query(statement, parameters, elapsed)
+
+
+def log_slow_query(statement: str, parameters, seconds: float):
+    """Writes a slow statement to the log as one line of JSON"""
+    entry = {
+        "event": "slow_query",
+        "duration_ms": round(seconds * 1000, 3),
+        "statement": " ".join(statement.split()),
+        # an executemany passes a list with one entry per row
+        "parameters": repr(parameters[:MAX_LOGGED_ROWS] if isinstance(parameters, list) else parameters)[
+            :MAX_LOGGED_PARAMETERS],
+    }
+    if has_request_context():
+        entry.update(method=request.method, path=request.full_path.rstrip("?"), resource=request.endpoint)
+    logger.warning(json.dumps(entry))
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    if context.connection is not None and context.connection.info.get("query_start"):
+        context.connection.info["query_start"].pop()
+
+
+def latest() -> tuple:
+    """Returns the exposition of every metric and its content type
+
+    In multiprocess mode the samples of all workers are merged, live or
+    dead, so counters never go backwards when a worker is recycled.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
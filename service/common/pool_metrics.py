@@ -0,0 +1,105 @@
+"""
+Connection Pool Metrics
+
+This module contains a QueuePool that records how long callers wait for
+a connection, how often the pool has to open overflow connections and
+how often a checkout times out, so pools can be sized per worker
+"""
+import logging
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger("flask.app")
+
+
+class PoolMetrics:
+    """Thread-safe counters describing connection checkouts of one process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Sets every counter back to zero"""
+        with self._lock:
+            self.checkouts = 0
+            self.overflows = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def record_checkout(self, wait: float, overflow: bool):
+        """Records a successful checkout that waited wait seconds"""
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            if overflow:
+                self.overflows += 1
+
+    def record_timeout(self, wait: float):
+        """Records a checkout that gave up after wait seconds"""
+        with self._lock:
+            self.timeouts += 1
+            self.wait_max = max(self.wait_max, wait)
+
+    def stats(self, pool=None) -> dict:
+        """Returns the counters, plus the live gauges of pool if given"""
+        with self._lock:
+            data = {
+                "checkouts": self.checkouts,
+                "overflows": self.overflows,
+                "timeouts": self.timeouts,
+                "wait_ms_total": round(self.wait_total * 1000, 3),
+                "wait_ms_max": round(self.wait_max * 1000, 3),
+                "wait_ms_avg": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+            }
+        if isinstance(pool, QueuePool):
+            data.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=max(pool.overflow(), 0),
+                max_overflow=pool._max_overflow,  # pylint: disable=protected-access
+            )
+        return data
+
+
+pool_metrics = PoolMetrics()
+
+# whether the checkout running in this thread opened an overflow connection
+_checkout = threading.local()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool that reports its checkouts to pool_metrics"""
+
+    metrics = pool_metrics
+
+    def _do_get(self):
+        start = time.perf_counter()
+        _checkout.overflow = False
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout(time.perf_counter() - start)
+            logger.error("Connection pool exhausted: %s", self.status())
+            raise
+        # reusing an idle connection is no overflow, even while others are open
+        overflow = _checkout.overflow
+        self.metrics.record_checkout(time.perf_counter() - start, overflow)
+        if overflow:
+            logger.debug("Connection pool opened an overflow connection: %s", self.status())
+        return record
+
+    def _inc_overflow(self):
+        # QueuePool._inc_overflow, noting under the lock whether the
+        # connection about to be opened is beyond pool_size
+        with self._overflow_lock:
+            if self._max_overflow != -1 and self._overflow >= self._max_overflow:
+                return False
+            self._overflow += 1
+            _checkout.overflow = self._overflow > 0
+            return True
@@ -0,0 +1,137 @@
+"""
+Request Profiling
+
+This module contains an opt-in WSGI middleware that runs selected
+requests under cProfile and writes each profile to a directory as a
+pstats file, to be read with pstats, snakeviz or flameprof.
+
+A request is profiled when it carries the trusted header
+X-Profile: <PROFILE_TOKEN>, or at random with PROFILE_SAMPLE_RATE. The
+middleware is only installed when one of them is configured, so there
+is no overhead at all when profiling is off. The async reads of
+service.asgi bypass the WSGI stack and are never profiled.
+"""
+import cProfile
+import hmac
+import itertools
+import os
+import random
+import re
+import time
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+
+
+def init_profiling(app):
+    """Installs the profiling middleware on app if profiling is configured"""
+    token = app.config.get("PROFILE_TOKEN")
+    sample_rate = app.config.get("PROFILE_SAMPLE_RATE", 0.0)
+    if not token and sample_rate <= 0:
+        return
+    app.wsgi_app = ProfilerMiddleware(
+        app.wsgi_app,
+        app.config.get("PROFILE_DIR"),
+        token=token,
+        sample_rate=sample_rate,
+        max_files=app.config.get("PROFILE_MAX_FILES", 100),
+    )
+    app.logger.info("Profiling requests into %s (sample rate %s)", app.config.get("PROFILE_DIR"), sample_rate)
+
+
+class ProfilerMiddleware:  # pylint: disable=too-few-public-methods
+    """Runs trusted or sampled requests under cProfile"""
+
+    def __init__(self, wsgi_app, directory: str, token: str = None, sample_rate: float = 0.0, max_files: int = 100):
+        """
+        :param wsgi_app: the WSGI application to profile
+        :param directory: where the .prof files are written
+        :param token: the value of X-Profile that triggers profiling
+        :param sample_rate: the fraction of all requests that are profiled
+        :param max_files: the number of profiles kept, oldest are deleted
+        """
+        self.wsgi_app = wsgi_app
+        self.directory = directory
+        self.token = token
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self._counter = itertools.count()
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, environ, start_response):
+        requested = self._is_trusted(environ)
+        if not requested and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            return self.wsgi_app(environ, start_response)
+
+        profile_id = self._profile_id(environ)
+
+        def profiled_start_response(status, headers, exc_info=None):
+            if requested:
+                headers = list(headers) + [("X-Profile-Id", profile_id)]
+            return start_response(status, headers, exc_info)
+
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        iterable = profile.runcall(self.wsgi_app, environ, profiled_start_response)
+        return ProfiledBody(iterable, profile, lambda: self._dump(profile, profile_id, start))
+
+    def _dump(self, profile, profile_id: str, start: float):
+        """Writes the profile of a finished request and prunes the old ones"""
+        elapsed = time.perf_counter() - start
+        profile.dump_stats(os.path.join(self.directory, f"{profile_id}.{elapsed * 1000:.0f}ms.prof"))
+        self._prune()
+
+    def _is_trusted(self, environ) -> bool:
+        """Returns True if the request carries the profiling token"""
+        if not self.token:
+            return False
+        # WSGI header values are latin-1 strings; compare bytes so any value is accepted
+        return hmac.compare_digest(environ.get(PROFILE_HEADER, "").encode("latin-1"), self.token.encode("utf-8"))
+
+    def _profile_id(self, environ) -> str:
+        """Returns a unique, sortable name for the profile of a request"""
+        path = re.sub(r"[^A-Za-z0-9]+", "_", environ.get("PATH_INFO", "")).strip("_") or "root"
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        return f"{stamp}.{os.getpid()}.{next(self._counter)}.{environ.get('REQUEST_METHOD', 'GET')}.{path}"
+
+    def _prune(self):
+        """Deletes the oldest profiles beyond max_files"""
+        files = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".prof")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in files[:max(len(files) - self.max_files, 0)]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class ProfiledBody:
+    """Passes a response body through chunk by chunk, producing each one under the profiler
+
+    Streamed responses keep their flat memory and early first byte. The
+    profile is written when the server closes the body, as WSGI requires
+    it to whether or not the body was read to the end.
+    """
+
+    def __init__(self, iterable, profile, on_close):
+        self.iterable = iterable
+        self.profile = profile
+        self.on_close = on_close
+
+    def __iter__(self):
+        iterator = self.profile.runcall(iter, self.iterable)
+        while True:
+            try:
+                chunk = self.profile.runcall(next, iterator)
+            except StopIteration:
+                return
+            yield chunk
+
+    def close(self):
+        """Closes the wrapped body and writes the profile"""
+        try:
+            if hasattr(self.iterable, "close"):
+                self.profile.runcall(self.iterable.close)
+        finally:
+            self.on_close()
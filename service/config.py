@@ -2,6 +2,7 @@
 Global Configuration for Application
 """
 import os
+import tempfile
 
 # Get configuration from environment
 DATABASE_URI = os.getenv(
@@ -12,5 +13,57 @@ DATABASE_URI = os.getenv(
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Connection pool of each worker process. Pre-ping and recycling drop
+# connections that died with a database failover before they are used.
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("true", "1", "yes"),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+}
+# In-memory SQLite runs on a single static connection that cannot be sized
+if DATABASE_URI not in ("sqlite://", "sqlite:///:memory:"):
+    SQLALCHEMY_ENGINE_OPTIONS.update(
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    )
+
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "s3cr3t-key-shhhh")
+
+# Pagination of the product list
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# Rows fetched per round trip when streaming the catalog as NDJSON
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "1000"))
+
+# Maximum number of Products accepted by one POST /products/batch request
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "10000"))
+
+# Write-behind buffering of likes (off by default)
+LIKE_BUFFER_ENABLED = os.getenv("LIKE_BUFFER_ENABLED", "false").lower() in ("true", "1", "yes")
+# Maximum number of seconds a like stays buffered before it is flushed
+LIKE_BUFFER_FLUSH_INTERVAL = float(os.getenv("LIKE_BUFFER_FLUSH_INTERVAL", "1.0"))
+# Number of buffered likes that forces an immediate flush
+LIKE_BUFFER_MAX_PENDING = int(os.getenv("LIKE_BUFFER_MAX_PENDING", "10000"))
+
+# Read-through cache of single Products (a size of 0 disables it)
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "1024"))
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "5.0"))
+
+# Seconds before the in-memory name autocomplete index is rebuilt to pick
+# up changes made by other workers
+SUGGEST_INDEX_MAX_AGE = float(os.getenv("SUGGEST_INDEX_MAX_AGE", "60"))
+
+# Statements slower than this are written to the log with their parameters
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+# Report per-request database time in a Server-Timing response header
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() in ("true", "1", "yes")
+
+# Opt-in request profiling: requests sending X-Profile: <PROFILE_TOKEN>,
+# plus a random PROFILE_SAMPLE_RATE fraction of all requests, are run
+# under cProfile and saved to PROFILE_DIR
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "products-profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
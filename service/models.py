@@ -21,12 +21,24 @@ modified_date (timestamp) - the timestamp when the product is modified
 deleted_date (timestamp) - the timestamp when the product is deleted
 
 """
+import bisect
 import logging
+import threading
+import time
 
 # from enum import Enum
+from collections import Counter, OrderedDict
 from datetime import date
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import (
+    DDL, inspect, and_, bindparam, column, event, exists, false, func, literal_column, or_, select, table,
+    update,
+)
+from service.common.bulk_sql import (
+    advance_sequence, begin_immediate, copy_rows, insert_rows, last_id, merge_statement, stage_rows,
+)
+from service.common.pool_metrics import InstrumentedQueuePool
 
 logger = logging.getLogger("flask.app")
 
@@ -40,10 +52,220 @@ def init_db(app):
     Product.init_db(app)
 
 
+def rollback_session(error=None):
+    """Rolls back the session of a request that ended with an exception
+
+    Flask-SQLAlchemy removes the session when the app context of the
+    request is torn down; rolling back here first logs the failure and
+    returns the connection to the pool straight away.
+    """
+    if error is not None:
+        logger.warning("Rolling back the session of a failed request: %s", error)
+        db.session.rollback()
+
+
+def _commit():
+    """Commits the session, rolling it back if the commit fails"""
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _partitions(query, chunk_size: int):
+    """Runs query with a server-side cursor and yields its rows chunk_size at a time"""
+    result = db.session.execute(query.statement, execution_options={"yield_per": chunk_size})
+    yield from result.partitions()
+
+
 class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
+class ProductCache:
+    """
+    Bounded, TTL-aware LRU cache of serialized Products keyed by id
+
+    The cache is per process: writes through the model invalidate it
+    locally and the TTL bounds how stale other workers can be.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 5.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize: int, ttl: float):
+        """Resizes the cache and drops every entry"""
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._data.clear()
+
+    def get(self, product_id: int):
+        """Returns a copy of the cached Product dict, or None on a miss"""
+        with self._lock:
+            entry = self._data.get(product_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[product_id]
+                self.misses += 1
+                return None
+            self._data.move_to_end(product_id)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, product_id: int, data: dict):
+        """Caches a serialized Product, evicting the least recently used"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[product_id] = (time.monotonic() + self.ttl, data)
+            self._data.move_to_end(product_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, product_id: int):
+        """Drops a single Product from the cache"""
+        with self._lock:
+            self._data.pop(product_id, None)
+
+    def clear(self):
+        """Drops every Product from the cache"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """Returns the cache counters"""
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Read-through cache used by Product.find_cached()
+product_cache = ProductCache()
+
+
+class NameIndex:
+    """
+    Sorted in-memory index of Product names for prefix lookups
+
+    Names are kept case-insensitively sorted with the number of Products
+    carrying each one, so a lookup is a binary search plus a short scan.
+    Writes through the model keep it current, in bulk too; writes from
+    other workers are picked up by a rebuild once it is stale, while the
+    old index keeps serving.
+    """
+
+    def __init__(self, max_age: float = 60.0):
+        self.max_age = max_age
+        self._keys = []
+        self._counts = {}
+        self._built = None
+        self._expired = False
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def rebuild(self, counts):
+        """Replaces the index with (name, number of Products) pairs"""
+        with self._lock:
+            self._counts = dict(counts)
+            self._keys = sorted((name.lower(), name) for name in self._counts)
+            self._built = time.monotonic()
+            self._expired = False
+
+    def is_built(self) -> bool:
+        """Returns True once the index has been loaded"""
+        return self._built is not None
+
+    def is_stale(self) -> bool:
+        """Returns True if the index should be rebuilt"""
+        return self._built is None or self._expired or time.monotonic() - self._built > self.max_age
+
+    def invalidate(self):
+        """Marks the index stale, so the next lookup refreshes it"""
+        with self._lock:
+            self._expired = True
+
+    def start_refresh(self) -> bool:
+        """Returns True to the one caller that should rebuild the index until end_refresh()"""
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+            return True
+
+    def end_refresh(self):
+        """Lets the next stale lookup start another rebuild"""
+        with self._lock:
+            self._refreshing = False
+
+    def add(self, name: str, count: int = 1):
+        """Records count more Products with this name"""
+        with self._lock:
+            if name not in self._counts:
+                bisect.insort(self._keys, (name.lower(), name))
+            self._counts[name] = self._counts.get(name, 0) + count
+
+    def remove(self, name: str, count: int = 1):
+        """Records count less Products with this name"""
+        with self._lock:
+            remaining = self._counts.get(name, 0) - count
+            if remaining > 0:
+                self._counts[name] = remaining
+                return
+            if self._counts.pop(name, None) is not None:
+                key = (name.lower(), name)
+                index = bisect.bisect_left(self._keys, key)
+                if index < len(self._keys) and self._keys[index] == key:
+                    del self._keys[index]
+
+    def update(self, added=(), removed=()):
+        """Records (name, number of Products) pairs added and removed by a bulk write
+
+        The names are sorted again once instead of one insertion at a time.
+        """
+        with self._lock:
+            counts = self._counts
+            for name, count in removed:
+                remaining = counts.get(name, 0) - count
+                if remaining > 0:
+                    counts[name] = remaining
+                else:
+                    counts.pop(name, None)
+            for name, count in added:
+                counts[name] = counts.get(name, 0) + count
+            self._keys = sorted((name.lower(), name) for name in counts)
+
+    def suggest(self, prefix: str, limit: int) -> list:
+        """Returns up to limit names starting with prefix, ignoring case"""
+        prefix = prefix.lower()
+        with self._lock:
+            index = bisect.bisect_left(self._keys, (prefix,))
+            names = []
+            for key, name in self._keys[index:index + limit]:
+                if not key.startswith(prefix):
+                    break
+                names.append(name)
+            return names
+
+
+# Autocomplete index used by Product.suggest()
+product_names = NameIndex()
+
+
 # pylint: disable=too-many-instance-attributes
 class Product(db.Model):
     """
@@ -52,21 +274,33 @@ class Product(db.Model):
 
     app = None
 
+    # criteria that can be combined in search()
+    SEARCH_FIELDS = ("q", "name", "category", "price", "min_price", "max_price")
+    # columns that search() can sort by, prefixed with "-" for descending;
+    # rank orders full-text (q) matches best first
+    SORT_FIELDS = ("id", "price", "like", "created_date", "rank")
+
     ##################################################
     # Table Schema
     ##################################################
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(63), nullable=False)
+    name = db.Column(db.String(63), nullable=False, index=True)
     desc = db.Column(db.String(256))
-    price = db.Column(db.Float(), nullable=False)
-    category = db.Column(db.String(63), nullable=False)
+    price = db.Column(db.Float(), nullable=False, index=True)
+    category = db.Column(db.String(63), nullable=False, index=True)
     inventory = db.Column(db.Integer(), nullable=False)
     discount = db.Column(db.Float(), nullable=False, default=1)
-    like = db.Column(db.Integer(), nullable=False, default=0)
-    created_date = db.Column(db.Date(), nullable=False, default=date.today())
+    like = db.Column(db.Integer(), nullable=False, default=0, index=True)
+    created_date = db.Column(db.Date(), nullable=False, default=date.today(), index=True)
     modified_date = db.Column(db.Date())
     deleted_date = db.Column(db.Date())
+    # bumped by every write so clients can revalidate with ETags
+    version = db.Column(db.Integer(), nullable=False, default=1)
+
+    # ETags are built from ids and versions, so SQLite must never reuse the
+    # id of a deleted Product (Postgres sequences never go back anyway)
+    __table_args__ = {"sqlite_autoincrement": True}
 
     ##################################################
     # INSTANCE METHODS
@@ -82,7 +316,8 @@ class Product(db.Model):
         logger.info("Creating product %s", self.name)
         self.id = None  # pylint: disable=invalid-name
         db.session.add(self)
-        db.session.commit()
+        _commit()
+        product_names.add(self.name)
 
     def update(self):
         """
@@ -93,13 +328,24 @@ class Product(db.Model):
             raise DataValidationError("Update called with empty ID field")
         # if self.inventory < 0:
         #     raise DataValidationError("Update called with invalid Inventory field")
-        db.session.commit()
+        self.version = Product.version + 1
+        renamed = inspect(self).attrs.name.history
+        _commit()
+        product_cache.invalidate(int(self.id))
+        if renamed.added and renamed.deleted:
+            product_names.remove(renamed.deleted[0])
+            product_names.add(renamed.added[0])
+        elif renamed.added:
+            product_names.invalidate()
 
     def delete(self):
         """Removes a Product from the data store"""
         logger.info("Deleting product %s", self.name)
+        product_id, name = self.id, self.name
         db.session.delete(self)
-        db.session.commit()
+        _commit()
+        product_cache.invalidate(int(product_id))
+        product_names.remove(name)
 
     def serialize(self):
         """Serializes a Product into a dictionary"""
@@ -119,8 +365,26 @@ class Product(db.Model):
             "deleted_date": self.deleted_date.isoformat()
             if self.deleted_date is not None
             else None,
+            "version": self.version,
         }
 
+    @staticmethod
+    def serialize_row(row, fields=None) -> dict:
+        """Serializes a row of Product columns into the same dictionary as serialize()
+
+        Used by the lean read paths, which select column tuples instead of
+        building a Product instance for every row.
+
+        Args:
+            row (tuple): the column values, in the order of fields
+            fields (list): the column names, all of ROW_FIELDS by default
+        """
+        data = dict(zip(fields or ROW_FIELDS, row))
+        for field in DATE_FIELDS:
+            if data.get(field) is not None:
+                data[field] = data[field].isoformat()
+        return data
+
     def deserialize(self, data):
         """
         Deserializes a Product from a dictionary
@@ -167,7 +431,7 @@ class Product(db.Model):
             raise DataValidationError(
                 "Invalid product: missing " + error.args[0]
             ) from error
-        except TypeError as error:
+        except (TypeError, ValueError) as error:
             raise DataValidationError(
                 "Invalid product: body of request contained bad or no data - "
                 "Error message: " + str(error)
@@ -188,10 +452,194 @@ class Product(db.Model):
         """
         logger.info("Initializing database")
         cls.app = app
+        # Instrument the queue pool so /stats can report its checkouts
+        options = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+        if "pool_size" in options:
+            options.setdefault("poolclass", InstrumentedQueuePool)
         # This is where we initialize SQLAlchemy from the Flask app
         db.init_app(app)
-        app.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+        product_cache.configure(
+            app.config.get("PRODUCT_CACHE_SIZE", 1024),
+            app.config.get("PRODUCT_CACHE_TTL", 5.0),
+        )
+        product_names.max_age = app.config.get("SUGGEST_INDEX_MAX_AGE", 60.0)
+        # sessions live and die with the app context of each request, so
+        # no context is left pushed once the tables are created
+        if rollback_session not in app.teardown_request_funcs.get(None, []):
+            app.teardown_request(rollback_session)
+        with app.app_context():
+            db.create_all()  # make our sqlalchemy tables
+            # create_all() skips existing tables, so bring older ones up to date
+            with db.engine.begin() as connection:
+                upgrade_schema(connection)
+            cls.rebuild_name_index()
+
+    @classmethod
+    def bulk_create(cls, products: list) -> list:
+        """Creates many Products in a single transaction
+
+        The unit of work batches the INSERTs into executemany round trips
+        and fills in the generated ids on every Product.
+
+        :param products: the Products to create
+        :type products: list
+
+        :return: the same Products with their ids assigned
+        :rtype: list
+
+        """
+        logger.info("Creating %s products in bulk", len(products))
+        for product in products:
+            product.id = None
+        db.session.add_all(products)
+        _commit()
+        for product in products:
+            product_names.add(product.name)
+        return products
+
+    @classmethod
+    def bulk_load(cls, fields: list, rows) -> int:
+        """Inserts raw column tuples in a single transaction
+
+        Rows bypass the ORM entirely: Postgres receives them through
+        COPY FROM STDIN and every other database through one executemany
+        INSERT, so millions of rows load in seconds. Columns left out of
+        fields get their defaults and the database assigns the ids.
+
+        :param fields: the columns of every row, in order (see ROW_FIELDS)
+        :type fields: list
+        :param rows: tuples of values, dates as datetime.date
+        :type rows: list
+
+        :return: the number of rows inserted
+        :rtype: int
+
+        """
+        cls._columns(fields)  # rejects unknown fields
+        rows = rows if isinstance(rows, list) else list(rows)
+        logger.info("Loading %s product rows in bulk", len(rows))
+        if not rows:
+            return 0
+        # the column defaults are applied by SQLAlchemy, not the database
+        defaults = {
+            column.name: column.default.arg for column in cls.__table__.columns
+            if column.name not in fields and column.default is not None and column.default.is_scalar
+        }
+        if defaults:
+            fields = list(fields) + list(defaults)
+            extra = tuple(defaults.values())
+            rows = [tuple(row) + extra for row in rows]
+        try:
+            connection = db.session.connection()
+            if connection.dialect.name == "postgresql":
+                copy_rows(connection, cls.__table__.name, fields, rows)
+            elif connection.dialect.name == "sqlite":
+                _load_rows_sqlite(connection, fields, rows)
+            else:
+                connection.execute(cls.__table__.insert(), [dict(zip(fields, row)) for row in rows])
+        except Exception:
+            db.session.rollback()
+            raise
+        _commit()
+        product_cache.clear()
+        if "name" in fields:
+            name_index = list(fields).index("name")
+            product_names.update(added=Counter(row[name_index] for row in rows).items())
+        return len(rows)
+
+    @classmethod
+    def bulk_upsert(cls, fields: list, rows) -> tuple:
+        """Inserts or updates raw column tuples by id in a single transaction
+
+        The rows are staged in a temporary table, with COPY on Postgres,
+        and merged into the product table by one INSERT ... SELECT ... ON
+        CONFLICT (id) DO UPDATE statement. Rows whose id is None or
+        unknown are inserted, the others replace the existing Product
+        and bump its version. When an id repeats, the last row wins.
+        Ids are never reused, so a row with the id of a deleted Product
+        is inserted with a new one.
+
+        :param fields: the columns of every row, in order, id included
+        :type fields: list
+        :param rows: tuples of values, dates as datetime.date
+        :type rows: list
+
+        :return: the number of Products inserted and updated
+        :rtype: tuple
+
+        """
+        cls._columns(fields)  # rejects unknown fields
+        if "id" not in fields:
+            raise DataValidationError("Invalid fields: id is required to upsert")
+        id_index = list(fields).index("id")
+        # ids are positive, so rows without one get distinct negative keys
+        unique = {}
+        for number, row in enumerate(rows):
+            unique[row[id_index] if row[id_index] is not None else -1 - number] = row
+        rows = list(unique.values())
+        logger.info("Upserting %s product rows in bulk", len(rows))
+        if not rows:
+            return 0, 0
+        removed_names = []
+        try:
+            connection = db.session.connection()
+            staging = stage_rows(connection, cls.__table__, IMPORT_TABLE, fields, rows)
+            replaced = staging.join(cls.__table__, staging.c.id == cls.id)
+            updated = connection.execute(func.count().select().select_from(replaced)).scalar()
+            if "name" in fields:
+                removed_names = connection.execute(
+                    select(cls.name, func.count()).select_from(replaced).group_by(cls.name)
+                ).all()
+            connection.execute(
+                staging.update()
+                .where(staging.c.id <= last_id(connection, cls.__table__), ~exists().where(cls.id == staging.c.id))
+                .values(id=None)
+            )
+            connection.execute(merge_statement(connection.dialect.name, cls.__table__, staging, fields))
+            if connection.dialect.name == "postgresql":
+                advance_sequence(connection, cls.__table__)
+            connection.exec_driver_sql(f"DROP TABLE {IMPORT_TABLE}")
+        except Exception:
+            db.session.rollback()
+            raise
+        _commit()
+        product_cache.clear()
+        if "name" in fields:
+            name_index = list(fields).index("name")
+            product_names.update(Counter(row[name_index] for row in rows).items(), removed_names)
+        return len(rows) - updated, updated
+
+    @classmethod
+    def delete_where(cls, ids: list = None, **filters) -> int:
+        """Removes every Product matching the filters in one DELETE statement
+
+        :param ids: only delete Products with one of these ids
+        :type ids: list
+        :param filters: search criteria (i.e., category="dairy"), see search()
+
+        :return: the number of Products deleted
+        :rtype: int
+
+        """
+        logger.info("Deleting products with ids %s and filters %s", ids, filters)
+        query = cls.search(**filters)
+        if ids is not None:
+            query = query.filter(cls.id.in_(ids))
+        # the names go in the same transaction, so the index loses exactly what was deleted
+        everything = ids is None and not filters
+        removed_names = [] if everything else query.with_entities(cls.name, func.count(cls.id)).group_by(cls.name).all()
+        count = query.delete(synchronize_session=False)
+        _commit()
+        if ids is not None and not filters:
+            for product_id in ids:
+                product_cache.invalidate(product_id)
+        else:
+            product_cache.clear()
+        if everything:
+            product_names.rebuild([])
+        else:
+            product_names.update(removed=removed_names)
+        return count
 
     @classmethod
     def all(cls) -> list:
@@ -199,6 +647,207 @@ class Product(db.Model):
         logger.info("Processing all Products")
         return cls.query.all()
 
+    @classmethod
+    def search_rows(cls, sort: str = None, fields: list = None, **criteria) -> list:
+        """Returns the serialized Products matching the criteria
+
+        Selects plain column tuples rather than ORM instances, skipping the
+        identity map and per-row object construction, and serializes each
+        one with serialize_row().
+
+        :param sort: one of SORT_FIELDS, prefixed with "-" for descending
+        :type sort: str
+        :param fields: the columns to select and return, all of them by default
+        :type fields: list
+        :param criteria: search criteria (i.e., category="dairy"), see search()
+
+        :return: a list of serialized Products
+        :rtype: list
+
+        """
+        fields = fields or ROW_FIELDS
+        query = cls.rows_query(sort, fields, **criteria)
+        serialize_row = cls.serialize_row
+        return [serialize_row(row, fields) for row in query]
+
+    @classmethod
+    def rows_query(cls, sort: str = None, fields: list = None, **criteria):
+        """Returns the query of search_rows() without running it
+
+        The query's statement can be executed on any connection, which is
+        how the asynchronous read path shares it.
+
+        :return: a query of column tuples in the order of fields
+        :rtype: Query
+
+        """
+        return cls.search(sort=sort, **criteria).with_entities(*cls._columns(fields or ROW_FIELDS))
+
+    @classmethod
+    def page(cls, after_id: int, limit: int, sort: str = "id", after_value=None, fields: list = None,
+             **filters) -> list:
+        """Returns one page of serialized Products in sort order
+
+        Uses keyset pagination (WHERE (sort, id) > (after_value, after_id)
+        ORDER BY sort, id LIMIT n) so that deep pages cost the same as the
+        first one. The id, version and sort value are always returned,
+        whatever the fields, so the caller can build the next cursor and
+        the ETag of the page.
+
+        :param after_id: the id of the last Product of the previous page, or None
+        :type after_id: int
+        :param limit: the maximum number of Products to return
+        :type limit: int
+        :param sort: one of SORT_FIELDS, prefixed with "-" for descending
+        :type sort: str
+        :param after_value: the sort value of the last Product of the previous page, dates as datetime.date
+        :param fields: the columns to select and return, all of them by default
+        :type fields: list
+        :param filters: search criteria (i.e., category="dairy"), see search()
+
+        :return: a list of at most limit serialized Products
+        :rtype: list
+
+        """
+        logger.info("Processing page of products after id %s (limit %s) ...", after_id, limit)
+        query, fields = cls.page_query(after_id, limit, sort, after_value, fields, **filters)
+        return [cls.serialize_row(row, fields) for row in query]
+
+    @classmethod
+    def page_query(cls, after_id: int, limit: int, sort: str = "id", after_value=None, fields: list = None,
+                   **filters) -> tuple:
+        """Returns the query of page() without running it
+
+        :return: the query and the names of the columns it selects
+        :rtype: tuple
+
+        """
+        query = cls.search(sort=sort, **filters)
+        column, descending = cls._sort_column(sort, filters.get("q"))
+        if after_id is not None:
+            if column is cls.id:
+                after_value = after_id
+            beyond = column < after_value if descending else column > after_value
+            query = query.filter(or_(beyond, and_(column == after_value, cls.id > after_id)))
+
+        fields = list(fields or ROW_FIELDS)
+        columns = cls._columns(fields)
+        # the sort column may be the computed rank, so select its expression
+        for needed, needed_column in (("id", cls.id), ("version", cls.version), (sort.lstrip("-"), column)):
+            if needed not in fields:
+                fields.append(needed)
+                columns.append(needed_column)
+        return query.with_entities(*columns).limit(limit), fields
+
+    @classmethod
+    def stream(cls, chunk_size: int = 1000, sort: str = "id", fields: list = None, **filters):
+        """Yields all of the Products in sort order without loading them at once
+
+        Rows are fetched from a server-side cursor chunk_size at a time as
+        plain column tuples, so memory stays flat no matter how large the
+        catalog is. The query is built when stream() is called, so invalid
+        criteria raise DataValidationError before the first row is asked for.
+
+        :param chunk_size: the number of rows fetched per round trip
+        :type chunk_size: int
+        :param sort: one of SORT_FIELDS, prefixed with "-" for descending
+        :type sort: str
+        :param fields: the columns to select and return, all of them by default
+        :type fields: list
+        :param filters: search criteria (i.e., category="dairy"), see search()
+
+        :return: a generator of serialized Products, see serialize_row()
+        :rtype: generator
+
+        """
+        logger.info("Streaming products with filters %s ...", filters)
+        fields = fields or ROW_FIELDS
+        chunks = cls.stream_chunks(chunk_size, sort, fields, **filters)
+        serialize_row = cls.serialize_row
+        return (serialize_row(row, fields) for rows in chunks for row in rows)
+
+    @classmethod
+    def stream_chunks(cls, chunk_size: int = 1000, sort: str = "id", fields: list = None, **filters):
+        """Yields all of the Products in sort order as lists of column tuples
+
+        The chunked form of stream() for writers that handle a whole chunk
+        at once, i.e. CSV or Parquet exports. Each list holds at most
+        chunk_size rows fetched in one round trip. Like stream(), it
+        validates the criteria right away and only runs the query once
+        the first chunk is asked for.
+
+        :return: a generator of lists of rows in the order of fields
+        :rtype: generator
+
+        """
+        query = cls.rows_query(sort, fields, **filters)
+        return _partitions(query, chunk_size)
+
+    @classmethod
+    def _columns(cls, fields) -> list:
+        """Returns the table columns for a list of field names"""
+        for field in fields:
+            if field not in ROW_FIELDS:
+                raise DataValidationError(f"Invalid field: {field}")
+        return [cls.__table__.c[field] for field in fields]
+
+    @classmethod
+    def increment_like(cls, product_id: int, n: int = 1):
+        """Atomically adds n likes to a Product
+
+        Issues a single UPDATE ... SET like = like + n ... RETURNING, so
+        concurrent likes on the same Product are never lost.
+
+        :param product_id: the id of the Product to like
+        :type product_id: int
+        :param n: the number of likes to add
+        :type n: int
+
+        :return: the updated Product, or None if not found
+        :rtype: Product
+
+        """
+        logger.info("Adding %s like(s) to product id %s ...", n, product_id)
+        statement = (
+            update(cls)
+            .where(cls.id == product_id)
+            .values(like=cls.like + n, version=cls.version + 1)
+            .returning(cls)
+            .execution_options(synchronize_session="fetch")
+        )
+        product = db.session.execute(statement).scalar_one_or_none()
+        if product is not None:
+            # keep the RETURNING values instead of expiring them on commit
+            db.session.expunge(product)
+        _commit()
+        product_cache.invalidate(product_id)
+        return product
+
+    @classmethod
+    def increment_likes(cls, counts: dict):
+        """Adds likes to many Products in one batched UPDATE
+
+        :param counts: the number of likes to add keyed by Product id
+        :type counts: dict
+
+        """
+        logger.info("Adding buffered likes to %s products ...", len(counts))
+        table = cls.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("product_id"))
+            .values(like=table.c.like + bindparam("n"), version=table.c.version + 1)
+        )
+        params = [{"product_id": product_id, "n": n} for product_id, n in counts.items()]
+        try:
+            db.session.execute(statement, params)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        for product_id in counts:
+            product_cache.invalidate(product_id)
+
     @classmethod
     def find(cls, product_id: int):
         """Finds a Product by it's ID
@@ -213,6 +862,58 @@ class Product(db.Model):
         logger.info("Processing lookup for product id %s ...", product_id)
         return cls.query.get(product_id)
 
+    @classmethod
+    def find_version(cls, product_id: int):
+        """Returns the version of a Product without loading the row
+
+        :param product_id: the id of the Product
+        :type product_id: int
+
+        :return: the version of the Product, or None if not found
+        :rtype: int
+
+        """
+        logger.info("Processing version lookup for product id %s ...", product_id)
+        return db.session.query(cls.version).filter(cls.id == product_id).scalar()
+
+    @classmethod
+    def find_cached(cls, product_id: int):
+        """Finds a serialized Product by it's ID through the product cache
+
+        :param product_id: the id of the Product to find
+        :type product_id: int
+
+        :return: the serialized Product, or None if not found
+        :rtype: dict
+
+        """
+        data = product_cache.get(int(product_id))
+        if data is not None:
+            return data
+        return cls.load_cached(product_id)
+
+    @classmethod
+    def load_cached(cls, product_id: int):
+        """Reads a serialized Product from the database into the product cache
+
+        The second half of find_cached(), for callers that already looked
+        the Product up in the cache, so the miss is only counted once.
+
+        :param product_id: the id of the Product to load
+        :type product_id: int
+
+        :return: the serialized Product, or None if not found
+        :rtype: dict
+
+        """
+        product_id = int(product_id)
+        product = cls.find(product_id)
+        if product is None:
+            return None
+        data = product.serialize()
+        product_cache.put(product_id, data)
+        return dict(data)
+
     @classmethod
     def find_or_404(cls, product_id: int):
         """Find a Product by it's id
@@ -227,6 +928,119 @@ class Product(db.Model):
         logger.info("Processing lookup or 404 for product id %s ...", product_id)
         return cls.query.get_or_404(product_id)
 
+    @classmethod
+    def search(cls, sort: str = None, **criteria):
+        """Returns the Products matching every one of the given criteria
+
+        All criteria are combined with AND in a single query over the
+        indexed name, category and price columns and the full-text index
+        of name and desc. None values are ignored.
+
+        :param sort: one of SORT_FIELDS, prefixed with "-" for descending;
+            defaults to rank when q is given
+        :type sort: str
+        :param criteria: field values to match (i.e., category="dairy", q="cold milk")
+
+        :return: a query of the matching Products
+        :rtype: Query
+
+        """
+        logger.info("Processing product search for %s sorted by %s ...", criteria, sort)
+        query = cls.query
+        for field, value in criteria.items():
+            if value is None:
+                continue
+            if field not in cls.SEARCH_FIELDS:
+                raise DataValidationError(f"Invalid search field: {field}")
+            if field == "q":
+                query = cls._match(query, value)
+            elif field == "min_price":
+                query = query.filter(cls.price >= value)
+            elif field == "max_price":
+                query = query.filter(cls.price <= value)
+            else:
+                query = query.filter(getattr(cls, field) == value)
+        if sort is None and criteria.get("q") is not None:
+            sort = "rank"
+        if sort:
+            column, descending = cls._sort_column(sort, criteria.get("q"))
+            ordering = [column.desc() if descending else column]
+            if column is not cls.id:
+                ordering.append(cls.id)
+            query = query.order_by(*ordering)
+        return query
+
+    @classmethod
+    def _sort_column(cls, sort: str, q: str = None) -> tuple:
+        """Returns the column and direction named by a sort parameter"""
+        field = sort[1:] if sort.startswith("-") else sort
+        if field not in cls.SORT_FIELDS:
+            raise DataValidationError(f"Invalid sort field: {field}")
+        if field == "rank":
+            if q is None:
+                raise DataValidationError("Sorting by rank requires a q search")
+            return cls._rank(q), sort.startswith("-")
+        return getattr(cls, field), sort.startswith("-")
+
+    @classmethod
+    def _match(cls, query, q: str):
+        """Restricts a query to the Products whose name or desc match q"""
+        if db.engine.dialect.name == "postgresql":
+            return query.filter(literal_column(FULLTEXT_DOCUMENT).op("@@")(_tsquery(q)))
+        query = query.join(FTS_TABLE, FTS_TABLE.c.rowid == cls.id)
+        terms = _fts5_terms(q)
+        if not terms:
+            return query.filter(false())
+        return query.filter(literal_column(FTS_TABLE.name).op("MATCH")(terms))
+
+    @classmethod
+    def _rank(cls, q: str):
+        """Returns a relevance expression for q where lower is a better match"""
+        if db.engine.dialect.name == "postgresql":
+            return -func.ts_rank(literal_column(FULLTEXT_DOCUMENT), _tsquery(q))
+        return func.bm25(literal_column(FTS_TABLE.name))
+
+    @classmethod
+    def rebuild_name_index(cls):
+        """Loads every Product name and its count into the autocomplete index"""
+        logger.info("Building product name index")
+        counts = db.session.query(cls.name, func.count(cls.id)).group_by(cls.name).all()
+        product_names.rebuild(counts)
+
+    @classmethod
+    def refresh_name_index(cls):
+        """Rebuilds the autocomplete index in its own app context, for a background thread"""
+        try:
+            with cls.app.app_context():
+                cls.rebuild_name_index()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Could not rebuild the product name index")
+        finally:
+            product_names.end_refresh()
+
+    @classmethod
+    def suggest(cls, prefix: str, limit: int = 10) -> list:
+        """Returns Product names that start with a prefix
+
+        Lookups are served from the in-memory name index. Only the first
+        one waits for it to load; once it is stale a background thread
+        rebuilds it from the database while the old one keeps serving.
+
+        :param prefix: the beginning of the name, case is ignored
+        :type prefix: str
+        :param limit: the maximum number of names to return
+        :type limit: int
+
+        :return: matching names in alphabetical order
+        :rtype: list
+
+        """
+        if not product_names.is_built():
+            cls.rebuild_name_index()
+        elif product_names.is_stale() and product_names.start_refresh():
+            threading.Thread(target=cls.refresh_name_index, name="name-index", daemon=True).start()
+        return product_names.suggest(prefix, limit)
+
     @classmethod
     def find_by_name(cls, name: str) -> list:
         """Returns all Products with the given name
@@ -268,3 +1082,143 @@ class Product(db.Model):
         """
         logger.info("Processing product price query for %s ...", price)
         return cls.query.filter(cls.price == price)
+
+
+# column order of the rows handled by Product.serialize_row()
+ROW_FIELDS = tuple(column.name for column in Product.__table__.columns)
+DATE_FIELDS = ("created_date", "modified_date", "deleted_date")
+
+# temporary table Product.bulk_upsert() stages its rows in
+IMPORT_TABLE = "product_import"
+
+
+######################################################################
+#  F U L L - T E X T   I N D E X
+######################################################################
+
+# Postgres indexes this expression with GIN; queries must repeat it verbatim
+FULLTEXT_DOCUMENT = "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(\"desc\", ''))"
+
+# SQLite keeps an FTS5 index of name and desc in sync through triggers
+FTS_TABLE = table("product_fts", column("rowid"))
+FTS_INSERT_TRIGGER = """CREATE TRIGGER IF NOT EXISTS product_fts_insert AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, "desc") VALUES (new.id, new.name, new."desc");
+    END"""
+
+
+def _tsquery(q: str):
+    """Returns the Postgres query for free text typed by a user"""
+    return func.plainto_tsquery(literal_column("'english'"), q)
+
+
+def _fts5_terms(q: str) -> str:
+    """Quotes every word of q so user input is never parsed as FTS5 syntax"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in q.split())
+
+
+def _load_rows_sqlite(connection, fields: list, rows: list):
+    """Inserts rows into SQLite and indexes them for full-text search at once
+
+    Feeding FTS5 one row at a time through its trigger is over ten times
+    slower than a single INSERT ... SELECT, so the trigger is dropped for
+    the load. It all happens in one transaction that holds the write lock
+    from the start, so no other writer ever sees the table without the
+    trigger and a failed load restores it.
+    """
+    product_table = Product.__table__
+    begin_immediate(connection)
+    last_id = connection.execute(func.max(product_table.c.id)).scalar() or 0
+    connection.exec_driver_sql("DROP TRIGGER IF EXISTS product_fts_insert")
+    insert_rows(connection, product_table, fields, rows)
+    connection.exec_driver_sql(
+        'INSERT INTO product_fts(rowid, name, "desc") SELECT id, name, "desc" FROM product WHERE id > ?', (last_id,)
+    )
+    connection.exec_driver_sql(FTS_INSERT_TRIGGER)
+
+
+POSTGRES_FULLTEXT_DDL = (
+    f"CREATE INDEX IF NOT EXISTS ix_product_fulltext ON product USING gin ({FULLTEXT_DOCUMENT})",
+)
+FTS_TRIGGERS = (
+    FTS_INSERT_TRIGGER,
+    """CREATE TRIGGER IF NOT EXISTS product_fts_delete AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, "desc") VALUES ('delete', old.id, old.name, old."desc");
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_update AFTER UPDATE OF name, "desc" ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, "desc") VALUES ('delete', old.id, old.name, old."desc");
+        INSERT INTO product_fts(rowid, name, "desc") VALUES (new.id, new.name, new."desc");
+    END""",
+)
+
+SQLITE_FULLTEXT_DDL = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(name, "desc", content=product, content_rowid=id)',
+    "INSERT INTO product_fts(product_fts) VALUES ('rebuild')",
+    *FTS_TRIGGERS,
+)
+
+for statement in POSTGRES_FULLTEXT_DDL:
+    event.listen(Product.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_FULLTEXT_DDL:
+    event.listen(Product.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Product.__table__, "before_drop", DDL("DROP TABLE IF EXISTS product_fts").execute_if(dialect="sqlite"))
+
+
+######################################################################
+#  S C H E M A   U P G R A D E S
+######################################################################
+
+def upgrade_schema(connection):
+    """Brings a product table created by an older release up to date
+
+    Every step checks the schema first, so it runs on each start at the
+    cost of a few catalog queries and never touches the data twice.
+    """
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql("ALTER TABLE product ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1")
+        # builds the full-text index once, a table without it scans every row on ?q=
+        for statement in POSTGRES_FULLTEXT_DDL:
+            connection.exec_driver_sql(statement)
+    elif connection.dialect.name == "sqlite":
+        _upgrade_sqlite(connection)
+
+
+def _upgrade_sqlite(connection):
+    """Runs upgrade_schema() on SQLite, holding the write lock so workers upgrade one after the other"""
+    begin_immediate(connection)
+    columns = [row[1] for row in connection.exec_driver_sql("PRAGMA table_info(product)")]
+    if "version" not in columns:
+        logger.info("Adding the version column to the product table")
+        connection.exec_driver_sql("ALTER TABLE product ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    schema = connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'product'")
+    if "AUTOINCREMENT" not in schema.scalar().upper():
+        _recreate_sqlite_table(connection)
+    if connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'product_fts'").first() is None:
+        logger.info("Building the full-text index of the product table")
+        statements = SQLITE_FULLTEXT_DDL
+    else:
+        statements = FTS_TRIGGERS
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+def _recreate_sqlite_table(connection):
+    """Copies the product table into a new AUTOINCREMENT one, so deleted ids are never reused
+
+    SQLite cannot add AUTOINCREMENT to an existing table. The ids are
+    copied as they are and the full-text index is rebuilt once at the end.
+    """
+    logger.info("Recreating the product table with AUTOINCREMENT ids")
+    product_table = Product.__table__
+    quote = connection.dialect.identifier_preparer.quote
+    for trigger in ("product_fts_insert", "product_fts_delete", "product_fts_update"):
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    connection.exec_driver_sql("ALTER TABLE product RENAME TO product_old")
+    for index in product_table.indexes:
+        connection.exec_driver_sql(f"DROP INDEX IF EXISTS {quote(index.name)}")
+    product_table.create(connection)
+    connection.exec_driver_sql("DROP TRIGGER IF EXISTS product_fts_insert")
+    columns = ", ".join(quote(field) for field in ROW_FIELDS)
+    connection.exec_driver_sql(f"INSERT INTO product ({columns}) SELECT {columns} FROM product_old")
+    connection.exec_driver_sql("DROP TABLE product_old")
+    connection.exec_driver_sql("INSERT INTO product_fts(product_fts) VALUES ('rebuild')")
+    connection.exec_driver_sql(FTS_INSERT_TRIGGER)
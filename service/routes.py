@@ -4,18 +4,38 @@ Products Service
 Paths:
 ------
 GET / - Displays a UI for Selenium testing
+GET /stats - Returns runtime statistics of the service
+GET /metrics - Returns the Prometheus metrics of the service
 GET /products - Returns a list all of the Products
+GET /products?limit={n}&next={cursor} - Returns one page of Products
+GET /products?min_price={p}&max_price={p}&sort={field} - Returns Products in a price range, sorted
+GET /products?q={words} - Returns the Products whose name or description match, best match first
+GET /products (Accept: application/x-ndjson) - Streams all the Products, one per line
 GET /products/{product_id} - Returns the Product with a given id number
+GET /products?fields={f1,f2} and /products/{product_id}?fields={f1,f2} - Return only some fields
+GET /products/suggest?prefix={p} - Returns Product names starting with a prefix
 POST /products - Creates a new Product record in the database
+POST /products/batch - Creates many Product records in one transaction
+DELETE /products?{filter}={value} - Deletes every Product matching the filter
 PUT /products/{product_id} - Updates a Product record in the database
 DELETE /products/{product_id} - Deletes a Product record in the database
 PUT /products/{product_id}/like - Likes a Product with a given id number
 """
-
-from flask import jsonify
-from flask_restx import Resource, fields, reqparse
+import atexit
+import base64
+import binascii
+import hashlib
+import json
+from datetime import date
+
+from flask import Response, jsonify, request, stream_with_context
+from flask_restx import Resource, fields, inputs, reqparse
+from werkzeug.http import quote_etag
 from service.common import status  # HTTP Status Codes
-from service.models import Product
+from service.common.like_buffer import LikeBuffer
+from service.models import db, Product, DataValidationError, ROW_FIELDS, product_cache
+from service.common import metrics
+from service.common.pool_metrics import pool_metrics
 
 # Import Flask application
 from . import app, api
@@ -54,14 +74,66 @@ product_model = api.inherit(
     {
         'id': fields.Integer(readOnly=True,
                              description='The unique id assigned internally by service'),
+        'version': fields.Integer(readOnly=True,
+                                  description='Incremented every time the Product changes'),
     }
 )
 
+product_page_model = api.model('ProductPage', {
+    'items': fields.List(fields.Nested(product_model),
+                         description='The Products on this page'),
+    'next': fields.String(description='Opaque cursor for the next page, or null on the last page'),
+})
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# the columns list_etag() is built from
+VERSION_FIELDS = ["id", "version"]
+
+# the JSON types of the sort values in pagination cursors, dates as ISO strings
+CURSOR_TYPES = {"id": int, "price": (int, float), "like": int, "created_date": str, "rank": (int, float)}
+
+SORT_CHOICES = [prefix + field for field in Product.SORT_FIELDS for prefix in ('', '-')]
+
 # query string arguments
 product_args = reqparse.RequestParser()
+product_args.add_argument('q', type=str, location='args', required=False,
+                          help='List Products whose name or description match these words, best match first')
 product_args.add_argument('name', type=str, location='args', required=False, help='List Products by name')
 product_args.add_argument('category', type=str, location='args', required=False, help='List Products by category')
-product_args.add_argument('price', type=str, location='args', required=False, help='List Products by Price')
+product_args.add_argument('price', type=float, location='args', required=False, help='List Products by Price')
+product_args.add_argument('min_price', type=float, location='args', required=False,
+                          help='List Products priced at least this much')
+product_args.add_argument('max_price', type=float, location='args', required=False,
+                          help='List Products priced at most this much')
+product_args.add_argument('sort', type=str, location='args', required=False,
+                          choices=SORT_CHOICES, help='Sort Products by this field, prefix with - for descending')
+product_args.add_argument('fields', type=str, location='args', required=False,
+                          help='Comma separated list of the fields to return, i.e. id,name,price')
+product_args.add_argument('limit', type=int, location='args', required=False, help='Maximum number of Products per page')
+product_args.add_argument('next', type=str, location='args', required=False, help='Cursor returned by the previous page')
+
+delete_args = reqparse.RequestParser()
+delete_args.add_argument('id', type=int, location='args', action='append', required=False,
+                         help='Delete the Products with these ids')
+delete_args.add_argument('name', type=str, location='args', required=False, help='Delete Products by name')
+delete_args.add_argument('category', type=str, location='args', required=False, help='Delete Products by category')
+delete_args.add_argument('price', type=float, location='args', required=False, help='Delete Products by Price')
+delete_args.add_argument('min_price', type=float, location='args', required=False,
+                         help='Delete Products priced at least this much')
+delete_args.add_argument('max_price', type=float, location='args', required=False,
+                         help='Delete Products priced at most this much')
+delete_args.add_argument('all', type=inputs.boolean, location='args', required=False, default=False,
+                         help='Must be true to delete every Product when no filter is given')
+
+fields_args = reqparse.RequestParser()
+fields_args.add_argument('fields', type=str, location='args', required=False,
+                         help='Comma separated list of the fields to return, i.e. id,name,price')
+
+suggest_args = reqparse.RequestParser()
+suggest_args.add_argument('prefix', type=str, location='args', required=True, help='Beginning of the Product name')
+suggest_args.add_argument('limit', type=int, location='args', required=False, default=10,
+                          help='Maximum number of names to return')
 
 
 ######################################################################
@@ -73,6 +145,28 @@ def health():
     return jsonify(dict(status="OK")), status.HTTP_200_OK
 
 
+######################################################################
+# STATS ENDPOINT
+######################################################################
+@app.route("/stats")
+def stats():
+    """Endpoint to report runtime statistics of this worker."""
+    return jsonify(
+        product_cache=product_cache.stats(),
+        pool=pool_metrics.stats(db.engine.pool),
+    ), status.HTTP_200_OK
+
+
+######################################################################
+# METRICS ENDPOINT
+######################################################################
+@app.route("/metrics")
+def prometheus_metrics():
+    """Endpoint to expose request and database metrics to Prometheus."""
+    body, content_type = metrics.latest()
+    return Response(body, status=status.HTTP_200_OK, content_type=content_type)
+
+
 ######################################################################
 # GET INDEX
 ######################################################################
@@ -100,8 +194,10 @@ class ProductResource(Resource):
     # RETRIEVE A PRODUCT
     # ------------------------------------------------------------------
     @api.doc('get_products')
+    @api.expect(fields_args, validate=True)
+    @api.response(200, 'Success', product_model)
+    @api.response(304, 'Product not modified')
     @api.response(404, 'Product not found')
-    @api.marshal_with(product_model)
     def get(self, product_id):
         """
         Retrieve a single Product
@@ -111,11 +207,24 @@ class ProductResource(Resource):
         app.logger.info("Request for product with id: %s", product_id)
         if not product_id.isdigit():
             abort(status.HTTP_400_BAD_REQUEST, "Required digits for Product Id.")
-        product = Product.find(product_id)
+        fields = parse_fields(fields_args.parse_args()['fields'])
+        # whole Products are cached, so fields only trims the response
+        product = product_cache.get(int(product_id))
+        if request.if_none_match:
+            # a cached version is as fresh as a cached body, so only a miss asks the database
+            version = product["version"] if product is not None else Product.find_version(product_id)
+            etag = product_etag(product_id, version, fields)
+            if version is not None and etag in request.if_none_match:
+                app.logger.info("Product with id [%s] not modified", product_id)
+                return not_modified(etag)
+        if product is None:
+            product = Product.load_cached(product_id)
         if not product:
             abort(status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found.")
-        app.logger.info("Returning product: %s", product.name)
-        return product.serialize(), status.HTTP_200_OK
+        app.logger.info("Returning product: %s", product["name"])
+        etag = product_etag(product["id"], product["version"], fields)
+        body = api.marshal(product, product_model, mask=fields_mask(fields))
+        return body, status.HTTP_200_OK, {"ETag": quote_etag(etag)}
 
     # ------------------------------------------------------------------
     # UPDATE AN EXISTING PRODUCT
@@ -184,29 +293,81 @@ class ProductCollection(Resource):
     # ------------------------------------------------------------------
     @api.doc('list_products')
     @api.expect(product_args, validate=True)
-    @api.marshal_list_with(product_model)
+    @api.response(200, 'Success', [product_model])
+    @api.response(304, 'Products not modified')
+    @api.response(400, 'The pagination parameters were not valid')
     def get(self):
-        """ Returns all of the Products """
+        """
+        Returns all of the Products
+
+        Passing limit and/or next switches to keyset pagination: the response
+        becomes a ProductPage and the next page is linked in the Link header.
+        Sending Accept: application/x-ndjson streams every Product instead.
+        """
         app.logger.info("Request to list Products...")
 
-        products = []
         args = product_args.parse_args()
-        if args['category']:
-            app.logger.info('Filtering by category: %s', args['category'])
-            products = Product.find_by_category(args['category'])
-        elif args['name']:
-            app.logger.info('Filtering by name: %s', args['name'])
-            products = Product.find_by_name(args['name'])
-        elif args['price']:
-            app.logger.info('Filtering by price: %s', args['price'])
-            products = Product.find_by_price(args['price'])
+        if request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE:
+            return self._get_stream(args)
+
+        params = page_params(args) if is_paged(args) else None
+        if request.if_none_match:
+            # only the ids and versions are needed to tell whether the list changed
+            query, _ = list_query(args, params, VERSION_FIELDS)
+            etag = list_etag(args, query)
+            if etag in request.if_none_match:
+                app.logger.info("Product list not modified")
+                return not_modified(etag)
+
+        if params:
+            app.logger.info('Returning page after id %s sorted by %s', params['after_id'], params['sort'])
         else:
-            app.logger.info('Returning unfiltered list.')
-            products = Product.all()
+            app.logger.info('Filtering by: %s', list_filters(args))
+        query, fields = list_query(args, params)
+        products = [Product.serialize_row(row, fields) for row in query]
+        app.logger.info('[%s] Products returned', len(products))
+        results, headers = list_response(args, params, products)
+        return results, status.HTTP_200_OK, headers
+
+    @staticmethod
+    def _get_stream(args):
+        """Streams the Products matching args as newline delimited JSON"""
+        filters = list_filters(args)
+        app.logger.info('Streaming Products with filters %s', filters)
+        chunk_size = app.config['STREAM_CHUNK_SIZE']
+        fields = parse_fields(args['fields'])
+        # built before the response, so a bad query is a 400 rather than a broken 200
+        products = Product.stream(chunk_size, default_sort(args), fields, **filters)
+
+        def generate():
+            for product in products:
+                yield json.dumps(product) + "\n"
+
+        return Response(stream_with_context(generate()), status=status.HTTP_200_OK, mimetype=NDJSON_MIMETYPE)
 
-        # app.logger.info('[%s] Products returned', len(products))
-        results = [product.serialize() for product in products]
-        return results, status.HTTP_200_OK
+    # ------------------------------------------------------------------
+    # DELETE MANY PRODUCTS
+    # ------------------------------------------------------------------
+    @api.doc('delete_products_bulk')
+    @api.expect(delete_args, validate=True)
+    @api.response(200, 'Products deleted')
+    @api.response(400, 'No filter was given and all was not true')
+    def delete(self):
+        """
+        Delete many Products
+
+        This endpoint deletes every Product matching the id/name/category/price
+        filters with a single DELETE statement and returns how many were removed
+        """
+        app.logger.info("Request to delete Products in bulk...")
+        args = delete_args.parse_args()
+        filters = list_filters(args)
+        if args['id'] is None and not filters and not args['all']:
+            abort(status.HTTP_400_BAD_REQUEST, "A filter or all=true is required to delete Products in bulk.")
+
+        count = Product.delete_where(args['id'], **filters)
+        app.logger.info("[%s] Products deleted.", count)
+        return {"deleted": count}, status.HTTP_200_OK
 
     # ------------------------------------------------------------------
     # ADD A NEW PRODUCT
@@ -233,6 +394,75 @@ class ProductCollection(Resource):
         return product.serialize(), status.HTTP_201_CREATED, {"Location": location_url}
 
 
+######################################################################
+#  PATH: /products/suggest
+######################################################################
+@api.route('/products/suggest')
+class SuggestResource(Resource):
+    """ Autocomplete of Product names """
+
+    @api.doc('suggest_products')
+    @api.expect(suggest_args, validate=True)
+    @api.response(400, 'The limit was not valid')
+    def get(self):
+        """
+        Suggest Product names
+
+        This endpoint returns the Product names starting with a prefix
+        from an in-memory index, without querying the database
+        """
+        args = suggest_args.parse_args()
+        app.logger.info("Request for name suggestions for: %s", args['prefix'])
+        if args['limit'] < 1 or args['limit'] > app.config['MAX_PAGE_SIZE']:
+            abort(status.HTTP_400_BAD_REQUEST,
+                  f"limit must be between 1 and {app.config['MAX_PAGE_SIZE']}.")
+        return Product.suggest(args['prefix'], args['limit']), status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /products/batch
+######################################################################
+@api.route('/products/batch')
+class ProductBatchCollection(Resource):
+    """ Handles bulk creation of Products """
+
+    @api.doc('create_products_batch')
+    @api.response(400, 'One or more of the posted Products were not valid')
+    @api.response(413, 'Too many Products in one batch')
+    @api.expect([create_model])
+    @api.marshal_list_with(product_model, code=201)
+    def post(self):
+        """
+        Creates many Products
+        This endpoint validates every Product in the posted array and then
+        inserts all of them in a single transaction. Nothing is created if
+        any Product is invalid.
+        """
+        app.logger.info("Request to Create a batch of Products")
+
+        data = api.payload
+        if not isinstance(data, list):
+            abort(status.HTTP_400_BAD_REQUEST, "Request body must be an array of Products.")
+        if len(data) > app.config['MAX_BATCH_SIZE']:
+            abort(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                  f"A batch may contain at most {app.config['MAX_BATCH_SIZE']} Products.")
+
+        products = []
+        errors = []
+        for index, item in enumerate(data):
+            try:
+                products.append(Product().deserialize(item))
+            except DataValidationError as error:
+                errors.append({"index": index, "message": str(error)})
+        if errors:
+            app.logger.error("Rejected batch with %s invalid Products", len(errors))
+            api.abort(status.HTTP_400_BAD_REQUEST, f"{len(errors)} Products were not valid.", errors=errors)
+
+        Product.bulk_create(products)
+        app.logger.info("Created a batch of [%s] Products.", len(products))
+        return [product.serialize() for product in products], status.HTTP_201_CREATED
+
+
 ######################################################################
 #  PATH: /products/{product_id}/like
 ######################################################################
@@ -252,17 +482,28 @@ class LikeResource(Resource):
 
         if not product_id.isdigit():
             abort(status.HTTP_400_BAD_REQUEST, "Required digits for Product Id.")
-        product = Product.find(product_id)
+        if app.config['LIKE_BUFFER_ENABLED']:
+            return self._buffer_like(int(product_id))
+
+        product = Product.increment_like(int(product_id))
         if not product:
             abort(status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found.")
 
-        app.logger.info("Product with id [%s] like count before update: %s", product.like)
-        product.like += 1
-        product.update()
-        app.logger.info("Product with id [%s] updated.", product.id)
-        app.logger.info("Product with id [%s] like count after update: %s", product.like)
+        app.logger.info("Product with id [%s] like count after update: %s", product.id, product.like)
         return product.serialize(), status.HTTP_200_OK
 
+    @staticmethod
+    def _buffer_like(product_id):
+        """Buffers a like to be written behind by the like buffer"""
+        product = Product.find_cached(product_id)
+        if not product:
+            abort(status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found.")
+        buffered = like_buffer.add(product_id)
+        # the stored count does not include likes that are still buffered
+        product["like"] += buffered
+        app.logger.info("Product with id [%s] has %s buffered like(s)", product_id, buffered)
+        return product, status.HTTP_200_OK
+
 
 ######################################################################
 # QUERY PRODUCTS
@@ -306,3 +547,172 @@ def abort(error_code: int, message: str):
     """Logs errors before aborting"""
     app.logger.error(message)
     api.abort(error_code, message)
+
+
+def list_filters(args) -> dict:
+    """Returns the column filters present in the parsed query arguments"""
+    return {key: args.get(key) for key in Product.SEARCH_FIELDS if args.get(key) not in (None, '')}
+
+
+def parse_fields(value: str) -> list:
+    """Returns the list of fields requested with ?fields=, or None for all of them"""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in ROW_FIELDS]
+    if unknown or not fields:
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid fields: {', '.join(unknown)}. Allowed: {', '.join(ROW_FIELDS)}.")
+    return fields
+
+
+def fields_mask(fields: list) -> str:
+    """Returns the flask-restx mask that marshals only the requested fields"""
+    return "{" + ",".join(fields) + "}" if fields else None
+
+
+def product_etag(product_id, version, fields: list = None) -> str:
+    """Returns the strong ETag of a single Product representation"""
+    etag = f"{product_id}-{version}"
+    if fields:
+        etag += "-" + hashlib.sha1(",".join(fields).encode("utf-8")).hexdigest()[:12]
+    return etag
+
+
+def list_etag(args, rows) -> str:
+    """Returns the ETag of a list query from the (id, version) leading each of its rows
+
+    Every change to a Product bumps its version and ids are never reused,
+    so the pairs identify the content of the response.
+    """
+    versions = [tuple(row[:2]) for row in rows]
+    key = json.dumps([sorted(args.items()), versions], default=str)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def not_modified(etag: str) -> Response:
+    """Returns an empty 304 Not Modified response carrying the ETag"""
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response.set_etag(etag)
+    return response
+
+
+def flush_likes(counts: dict):
+    """Writes buffered likes to the database from outside a request"""
+    with app.app_context():
+        Product.increment_likes(counts)
+
+
+like_buffer = LikeBuffer(
+    flush_likes,
+    app.config['LIKE_BUFFER_FLUSH_INTERVAL'],
+    app.config['LIKE_BUFFER_MAX_PENDING'],
+)
+# drain anything still buffered when the worker exits
+atexit.register(like_buffer.stop)
+
+
+def default_sort(args) -> str:
+    """Returns the sort order of a list query: best match first for q, else by id"""
+    if args['sort']:
+        return args['sort']
+    return 'rank' if args['q'] else 'id'
+
+
+def is_paged(args) -> bool:
+    """Returns True if the list query in args asks for keyset pagination"""
+    return args['limit'] is not None or args['next'] is not None
+
+
+def list_query(args, params: dict = None, fields: list = None) -> tuple:
+    """Returns the query of a list request and the names of the columns it selects
+
+    params are those of page_params() for a page, or None for the whole
+    list. The id and version are always selected first, after fields, so
+    that list_etag() can be built from the rows.
+    """
+    if params is not None:
+        return Product.page_query(**dict(params, fields=fields or params['fields']))
+    fields = list(fields or ROW_FIELDS)
+    fields += [field for field in VERSION_FIELDS if field not in fields]
+    return Product.rows_query(args['sort'], fields, **list_filters(args)), fields
+
+
+def list_response(args, params: dict, products: list) -> tuple:
+    """Returns the body of a list request and its headers, ETag included, for the serialized rows"""
+    etag = list_etag(args, [(product["id"], product["version"]) for product in products])
+    if params is not None:
+        body, headers = page_response(args, params, products)
+    else:
+        # serialized rows already have the shape of product_model
+        fields = parse_fields(args['fields'])
+        if fields and not set(VERSION_FIELDS).issubset(fields):
+            products = [{field: product[field] for field in fields} for product in products]
+        body, headers = products, {}
+    headers["ETag"] = quote_etag(etag)
+    return body, headers
+
+
+def page_params(args) -> dict:
+    """Returns the keyword arguments of Product.page() for the page requested in args
+
+    One extra row is requested so page_response() can tell whether
+    another page exists.
+    """
+    limit = args['limit'] if args['limit'] is not None else app.config['DEFAULT_PAGE_SIZE']
+    if limit < 1 or limit > app.config['MAX_PAGE_SIZE']:
+        abort(status.HTTP_400_BAD_REQUEST,
+              f"limit must be between 1 and {app.config['MAX_PAGE_SIZE']}.")
+    sort = default_sort(args)
+    after_id, after_value = decode_cursor(args['next'], sort) if args['next'] else (None, None)
+    return dict(list_filters(args), after_id=after_id, limit=limit + 1, sort=sort,
+                after_value=after_value, fields=parse_fields(args['fields']))
+
+
+def page_response(args, params: dict, products: list) -> tuple:
+    """Returns the marshalled ProductPage and its Link header for the rows of a page"""
+    limit, sort, fields = params['limit'] - 1, params['sort'], params['fields']
+    cursor = encode_cursor(products[limit - 1], sort) if len(products) > limit else None
+
+    headers = {}
+    if cursor:
+        query = dict(list_filters(args), limit=limit, next=cursor)
+        for key in ('sort', 'fields'):
+            if args[key]:
+                query[key] = args[key]
+        next_url = api.url_for(ProductCollection, _external=True, **query)
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    page = {"items": products[:limit], "next": cursor}
+    mask = f"{{items{fields_mask(fields)},next}}" if fields else None
+    return api.marshal(page, product_page_model, mask=mask), headers
+
+
+def encode_cursor(last_product: dict, sort: str) -> str:
+    """Encodes the position of the last Product on a page as an opaque cursor"""
+    field = sort.lstrip('-')
+    position = {"id": last_product["id"], "sort": sort, "value": last_product[field]}
+    payload = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> tuple:
+    """Decodes a cursor produced by encode_cursor into (last id, last sort value)
+
+    The value is checked against the type of the sort column, and dates
+    are parsed, so a tampered cursor never reaches the database.
+    """
+    field = sort.lstrip('-')
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded))
+        last_id, value = position["id"], position["value"]
+        valid = position["sort"] == sort and all(
+            isinstance(item, expected) and not isinstance(item, bool)
+            for item, expected in ((last_id, int), (value, CURSOR_TYPES[field]))
+        )
+        if valid and field == "created_date":
+            value = date.fromisoformat(value)
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        valid = False
+    if not valid:
+        abort(status.HTTP_400_BAD_REQUEST, "Invalid pagination cursor.")
+    return last_id, value
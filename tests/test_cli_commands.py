@@ -1,18 +1,25 @@
 """
 CLI Command Extensions for Flask
 """
+import csv
+import json
 import os
+import tempfile
+from datetime import date
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
-from click.testing import CliRunner
-from service.common.cli_commands import db_create
+from service import app
+import pyarrow.parquet as pq
+from service.common.cli_commands import db_create, db_seed, products_export, products_import
+from service.models import Product, db
+from tests.factories import ProductFactory
 
 
 class TestFlaskCLI(TestCase):
     """Test Flask CLI Commands"""
 
     def setUp(self):
-        self.runner = CliRunner()
+        self.runner = app.test_cli_runner()
 
     @patch('service.common.cli_commands.db')
     def test_db_create(self, db_mock):
@@ -21,3 +28,97 @@ class TestFlaskCLI(TestCase):
         with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+
+    def test_db_seed(self):
+        """It should seed the same synthetic products for the same seed"""
+        Product.init_db(app)
+        with app.app_context():
+            Product.delete_where()
+            result = self.runner.invoke(db_seed, ["--count", "25", "--categories", "3", "--batch-size", "10"])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn("Seeded 25 products", result.output)
+            products = Product.search(sort="id").all()
+            self.assertEqual(len(products), 25)
+            self.assertLessEqual(len({product.category for product in products}), 3)
+            first = [(product.name, product.price, product.created_date) for product in products]
+
+            Product.delete_where()
+            self.runner.invoke(db_seed, ["--count", "25", "--categories", "3"])
+            products = Product.search(sort="id").all()
+            self.assertEqual([(product.name, product.price, product.created_date) for product in products], first)
+            Product.delete_where()
+            db.session.remove()
+
+    def test_products_export(self):
+        """It should export every product as CSV, JSON Lines and Parquet"""
+        Product.init_db(app)
+        with app.app_context():
+            Product.delete_where()
+            products = Product.bulk_create(ProductFactory.create_batch(5))
+            expected = [product.serialize() for product in products]
+            with tempfile.TemporaryDirectory() as directory:
+                exported = {}
+                for file_format in ("csv", "jsonl", "parquet"):
+                    path = os.path.join(directory, f"products.{file_format}")
+                    result = self.runner.invoke(
+                        products_export, ["--format", file_format, "--output", path, "--chunk-size", "2"]
+                    )
+                    self.assertEqual(result.exit_code, 0, result.output)
+                    self.assertIn("Exported 5 products", result.output)
+                    exported[file_format] = path
+
+                with open(exported["jsonl"], encoding="utf-8") as file:
+                    self.assertEqual([json.loads(line) for line in file], expected)
+                with open(exported["csv"], encoding="utf-8") as file:
+                    rows = list(csv.DictReader(file))
+                self.assertEqual([int(row["id"]) for row in rows], [data["id"] for data in expected])
+                self.assertEqual(rows[0]["name"], expected[0]["name"])
+                self.assertEqual(rows[0]["created_date"], expected[0]["created_date"])
+                table = pq.read_table(exported["parquet"])
+                self.assertEqual(table.column_names, list(expected[0].keys()))
+                self.assertEqual(table.num_rows, 5)
+                self.assertEqual(table.column("created_date")[0].as_py(), date.fromisoformat(expected[0]["created_date"]))
+
+            result = self.runner.invoke(products_export, ["--format", "jsonl"])
+            self.assertEqual(len(result.stdout.splitlines()), 5)
+            Product.delete_where()
+            db.session.remove()
+
+    def test_products_import(self):
+        """It should upsert the valid products of a feed and report the rejected ones"""
+        Product.init_db(app)
+        with app.app_context():
+            Product.delete_where()
+            existing = Product.bulk_create(ProductFactory.create_batch(2))
+            feed = [product.serialize() for product in existing]
+            feed[0]["name"] = "Renamed"
+            feed.append(dict(ProductFactory().serialize(), id=None))
+            feed.append(dict(ProductFactory().serialize(), id=None, price=-1))
+            feed.append(dict(ProductFactory().serialize(), id=None, created_date="2020-13-01"))
+            feed.append(dict(ProductFactory().serialize(), id=None, name="x" * 64))
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "feed.jsonl")
+                with open(path, "w", encoding="utf-8") as file:
+                    file.write("\n".join(json.dumps(data) for data in feed) + "\nnot json\n")
+                result = self.runner.invoke(products_import, [path, "--batch-size", "2"])
+                self.assertEqual(result.exit_code, 0, result.output)
+                self.assertIn("Imported 1 new and 2 updated products, rejected 4", result.output)
+                for line in (4, 5, 6, 7):
+                    self.assertIn(f"Rejected line {line}:", result.output)
+                self.assertEqual(len(Product.all()), 3)
+                self.assertEqual(Product.find(existing[0].id).name, "Renamed")
+
+                # a CSV export imports back as updates only
+                path = os.path.join(directory, "products.csv")
+                self.runner.invoke(products_export, ["--output", path])
+                result = self.runner.invoke(products_import, [path])
+                self.assertIn("Imported 0 new and 3 updated products, rejected 0", result.output)
+
+                result = self.runner.invoke(products_import, [os.path.join(directory, "missing.csv")])
+                self.assertNotEqual(result.exit_code, 0)
+                os.rename(path, path + ".txt")
+                result = self.runner.invoke(products_import, [path + ".txt"])
+                self.assertNotEqual(result.exit_code, 0)
+                self.assertIn("use --format", result.output)
+            Product.delete_where()
+            db.session.remove()
@@ -0,0 +1,83 @@
+"""
+Test cases for the gunicorn configuration
+"""
+import os
+import runpy
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "gunicorn.conf.py")
+
+
+def load_conf(**env) -> dict:
+    """Executes gunicorn.conf.py with extra environment variables"""
+    with tempfile.TemporaryDirectory() as directory:
+        env.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(directory, "prometheus"))
+        with patch.dict(os.environ, env):
+            return runpy.run_path(CONF_PATH)
+
+
+class TestGunicornConf(TestCase):
+    """Gunicorn Configuration Tests"""
+
+    def setUp(self):
+        self.conf = load_conf()
+        self.tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name: str, content: str) -> str:
+        """Writes a fake cgroup file and returns its path"""
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content + "\n")
+        return path
+
+    def test_defaults(self):
+        """It should size gthread workers from the available CPUs"""
+        self.assertEqual(self.conf["workers"], 2 * self.conf["CPUS"] + 1)
+        self.assertEqual(self.conf["worker_class"], "gthread")
+        self.assertTrue(self.conf["preload_app"])
+        self.assertEqual(self.conf["max_requests_jitter"], self.conf["max_requests"] // 10)
+
+    def test_environment_overrides(self):
+        """It should take its settings from the environment"""
+        conf = load_conf(GUNICORN_WORKERS="3", GUNICORN_THREADS="1", GUNICORN_PRELOAD="false",
+                         GUNICORN_MAX_REQUESTS="500")
+        self.assertEqual(conf["workers"], 3)
+        self.assertEqual(conf["worker_class"], "sync")
+        self.assertFalse(conf["preload_app"])
+        self.assertEqual(conf["max_requests_jitter"], 50)
+
+    def test_cgroup_v2_limit(self):
+        """It should read the CPU quota of cgroup v2"""
+        limit = self.conf["cgroup_cpu_limit"]
+        with patch.dict(limit.__globals__, CGROUP_V2_CPU_MAX=self.write("cpu.max", "150000 100000")):
+            self.assertEqual(limit(), 1.5)
+            self.assertEqual(self.conf["available_cpus"](), min(len(os.sched_getaffinity(0)), 2))
+        with patch.dict(limit.__globals__, CGROUP_V2_CPU_MAX=self.write("cpu.max", "max 100000")):
+            self.assertIsNone(limit())
+
+    def test_cgroup_v1_limit(self):
+        """It should read the CPU quota of cgroup v1"""
+        limit = self.conf["cgroup_cpu_limit"]
+        paths = {
+            "CGROUP_V2_CPU_MAX": os.path.join(self.tmp.name, "missing"),
+            "CGROUP_V1_QUOTA": self.write("quota", "20000"),
+            "CGROUP_V1_PERIOD": self.write("period", "100000"),
+        }
+        with patch.dict(limit.__globals__, paths):
+            self.assertEqual(limit(), 0.2)
+            self.assertEqual(self.conf["available_cpus"](), 1)
+        paths["CGROUP_V1_QUOTA"] = self.write("quota", "-1")
+        with patch.dict(limit.__globals__, paths):
+            self.assertIsNone(limit())
+
+    def test_prometheus_dir_reset(self):
+        """It should only remove the Prometheus samples from the multiprocess directory"""
+        self.write("counter_123.db", "stale")
+        keep = self.write("notes.txt", "keep")
+        load_conf(PROMETHEUS_MULTIPROC_DIR=self.tmp.name)
+        self.assertEqual(os.listdir(self.tmp.name), [os.path.basename(keep)])
@@ -0,0 +1,53 @@
+"""
+Test cases for the write-behind Like Buffer
+"""
+from unittest import TestCase
+from unittest.mock import MagicMock
+from service.common.like_buffer import LikeBuffer
+
+
+class TestLikeBuffer(TestCase):
+    """Like Buffer Tests"""
+
+    def setUp(self):
+        self.flush_func = MagicMock()
+        self.buffer = LikeBuffer(self.flush_func, interval=60, max_pending=5)
+
+    def tearDown(self):
+        self.buffer.stop()
+
+    def test_coalesce_likes(self):
+        """It should coalesce likes per Product until flushed"""
+        self.assertEqual(self.buffer.add(1), 1)
+        self.assertEqual(self.buffer.add(1), 2)
+        self.assertEqual(self.buffer.add(2, 2), 2)
+        self.assertEqual(self.buffer.pending(1), 2)
+        self.flush_func.assert_not_called()
+        self.assertEqual(self.buffer.flush(), 4)
+        self.flush_func.assert_called_once_with({1: 2, 2: 2})
+        self.assertEqual(self.buffer.pending(1), 0)
+
+    def test_flush_when_full(self):
+        """It should flush as soon as max_pending likes are buffered"""
+        for _ in range(5):
+            self.buffer.add(7)
+        self.flush_func.assert_called_once_with({7: 5})
+
+    def test_flush_empty(self):
+        """It should not call the flush function when nothing is buffered"""
+        self.assertEqual(self.buffer.flush(), 0)
+        self.flush_func.assert_not_called()
+
+    def test_flush_failure_keeps_likes(self):
+        """It should keep the likes buffered when a flush fails"""
+        self.flush_func.side_effect = [RuntimeError("database is down"), None]
+        self.buffer.add(3, 2)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending(3), 2)
+        self.assertEqual(self.buffer.flush(), 2)
+
+    def test_stop_drains(self):
+        """It should drain the buffer when stopped"""
+        self.buffer.add(4)
+        self.buffer.stop()
+        self.flush_func.assert_called_once_with({4: 1})
@@ -0,0 +1,44 @@
+"""
+Test cases for the Prometheus metrics
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+from service.common.metrics import statement_type
+
+# two forked "workers" count requests, then the parent exposes the total
+MULTIPROCESS_SCRIPT = """
+import os
+from service.common.metrics import REQUESTS, latest
+for _ in range(2):
+    pid = os.fork()
+    if pid == 0:
+        REQUESTS.labels("product_collection", "GET", "200").inc(3)
+        os._exit(0)
+    os.waitpid(pid, 0)
+print(latest()[0].decode())
+"""
+
+
+class TestMetrics(TestCase):
+    """Prometheus Metrics Tests"""
+
+    def test_statement_type(self):
+        """It should label statements with their SQL verb"""
+        self.assertEqual(statement_type("SELECT * FROM product"), "SELECT")
+        self.assertEqual(statement_type("\n  update product SET x=1"), "UPDATE")
+        self.assertEqual(statement_type("CREATE TABLE product"), "OTHER")
+        self.assertEqual(statement_type("   "), "OTHER")
+
+    def test_multiprocess_aggregation(self):
+        """It should add up the samples of every worker process"""
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory, DATABASE_URI="sqlite://")
+            output = subprocess.run(
+                [sys.executable, "-c", MULTIPROCESS_SCRIPT], env=env, capture_output=True, text=True, check=True,
+            ).stdout
+        self.assertIn(
+            'products_http_requests_total{method="GET",resource="product_collection",status="200"} 6.0', output
+        )
@@ -11,10 +11,19 @@ While debugging just these tests it's convenient to use this:
 """
 import os
 import logging
+import threading
+import time
 import unittest
+from unittest.mock import patch
 from datetime import date
+from flask import has_app_context
+from sqlalchemy import Column, Date, Float, Integer, MetaData, String, Table
+from sqlalchemy.exc import IntegrityError
 from werkzeug.exceptions import NotFound
-from service.models import Product, DataValidationError, db
+from service.models import (
+    Product, DataValidationError, ProductCache, NameIndex, db, product_cache, product_names, rollback_session,
+    upgrade_schema,
+)
 from service import app
 from tests.factories import ProductFactory
 
@@ -42,16 +51,22 @@ class TestProductModel(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         """ This runs once after the entire test suite """
-        db.session.close()
+        with app.app_context():
+            db.session.close()
 
     def setUp(self):
         """ This runs before each test """
+        self.app_context = app.app_context()
+        self.app_context.push()
         db.session.query(Product).delete()  # clean up the last tests
         db.session.commit()
+        product_cache.clear()
+        product_names.rebuild([])
 
     def tearDown(self):
         """ This runs after each test """
         db.session.remove()
+        self.app_context.pop()
 
     ######################################################################
     #  T E S T   C A S E S
@@ -200,6 +215,14 @@ class TestProductModel(unittest.TestCase):
         self.assertEqual(product.modified_date, date.fromisoformat(data["modified_date"]))
         self.assertEqual(product.deleted_date, date.fromisoformat(data["deleted_date"]))
 
+    def test_search_rows(self):
+        """It should serialize column rows exactly like serialize()"""
+        products = ProductFactory.create_batch(3)
+        Product.bulk_create(products)
+        expected = [product.serialize() for product in Product.search(sort="id")]
+        self.assertEqual(Product.search_rows(sort="id"), expected)
+        self.assertEqual(list(Product.stream(2)), expected)
+
     def test_deserialize_missing_data(self):
         """It should not deserialize a Product with missing data"""
         data = {"id": 1, "name": "Tea", "category": "cat"}
@@ -212,6 +235,13 @@ class TestProductModel(unittest.TestCase):
         product = Product()
         self.assertRaises(DataValidationError, product.deserialize, data)
 
+    def test_deserialize_bad_date(self):
+        """It should not deserialize a Product with a malformed date"""
+        data = ProductFactory().serialize()
+        data["created_date"] = "2020-13-01"
+        product = Product()
+        self.assertRaises(DataValidationError, product.deserialize, data)
+
     def test_find_product(self):
         """It should Find a Product by ID"""
         products = ProductFactory.create_batch(5)
@@ -269,6 +299,432 @@ class TestProductModel(unittest.TestCase):
         for product in found:
             self.assertEqual(product.price, price)
 
+    def test_bulk_create(self):
+        """It should Create many Products in one transaction"""
+        products = ProductFactory.create_batch(10)
+        Product.bulk_create(products)
+        for product in products:
+            self.assertIsNotNone(product.id)
+        self.assertEqual(len(Product.all()), 10)
+
+    def test_bulk_load(self):
+        """It should Load raw rows in bulk and index them for search"""
+        fields = ["name", "desc", "price", "category", "inventory", "created_date", "modified_date"]
+        rows = [
+            ("Granola", "crunchy oats", 4.5, "pantry", 7, date(2020, 1, 2), None),
+            ("Milk", "whole milk", 2.0, "dairy", 3, date(2021, 5, 6), date(2021, 6, 7)),
+        ]
+        self.assertEqual(Product.bulk_load(fields, rows), 2)
+        self.assertEqual(Product.bulk_load(fields, []), 0)
+        products = Product.search(sort="price").all()
+        self.assertEqual([product.name for product in products], ["Milk", "Granola"])
+        self.assertEqual(products[0].modified_date, date(2021, 6, 7))
+        self.assertIsNone(products[1].modified_date)
+        self.assertEqual(products[1].created_date, date(2020, 1, 2))
+        self.assertEqual(products[1].version, 1)
+        self.assertEqual([product.name for product in Product.search(q="oats")], ["Granola"])
+        # later single inserts are still indexed
+        ProductFactory(name="Oat Bar", desc="oats").create()
+        self.assertEqual(len(Product.search(q="oats").all()), 2)
+        self.assertRaises(DataValidationError, Product.bulk_load, ["colour"], [("red",)])
+        # a failed load is rolled back and leaves the table writable
+        self.assertRaises(IntegrityError, Product.bulk_load, ["name"], [(None,)])
+        ProductFactory(name="Oat Milk", desc="oats").create()
+        self.assertEqual(len(Product.search(q="oats").all()), 3)
+
+    def test_bulk_upsert(self):
+        """It should Insert new and update existing Products by id in bulk"""
+        products = Product.bulk_create(ProductFactory.create_batch(3))
+        fields = ["id", "name", "desc", "price", "category", "inventory", "discount", "like", "created_date"]
+        rows = [
+            (products[0].id, "Granola", "crunchy oats", 4.5, "pantry", 7, 1.0, 2, date(2020, 1, 2)),
+            (None, "Skim Milk", "whole milk", 2.0, "dairy", 3, 1.0, 0, date(2021, 5, 6)),
+            (products[0].id, "Oat Granola", "crunchy oats", 5.5, "pantry", 7, 1.0, 2, date(2020, 1, 2)),
+        ]
+        self.assertEqual(Product.bulk_upsert(fields, rows), (1, 1))
+        db.session.expire_all()
+        updated = Product.find(products[0].id)
+        self.assertEqual(updated.name, "Oat Granola")
+        self.assertEqual(updated.price, 5.5)
+        self.assertEqual(updated.version, 2)
+        self.assertEqual(len(Product.all()), 4)
+        self.assertEqual([product.name for product in Product.search(q="oats")], ["Oat Granola"])
+        # new ids keep coming after the imported ones
+        product = ProductFactory()
+        product.create()
+        self.assertGreater(product.id, Product.find_by_name("Skim Milk")[0].id)
+        self.assertEqual(Product.bulk_upsert(fields, []), (0, 0))
+        self.assertRaises(DataValidationError, Product.bulk_upsert, fields[1:], rows)
+
+    def test_ids_not_reused(self):
+        """It should never give the id of a deleted Product to a new one"""
+        products = Product.bulk_create(ProductFactory.create_batch(3))
+        last_id = products[2].id
+        Product.delete_where([last_id])
+        product = ProductFactory()
+        product.create()
+        self.assertGreater(product.id, last_id)
+        # an import of the deleted id gets a new one too
+        fields = ["id", "name", "price", "category", "inventory"]
+        self.assertEqual(Product.bulk_upsert(fields, [(last_id, "Granola", 4.5, "pantry", 7)]), (1, 0))
+        self.assertIsNone(Product.find(last_id))
+        self.assertGreater(Product.find_by_name("Granola")[0].id, product.id)
+        # unknown ids past the last one are kept
+        self.assertEqual(Product.bulk_upsert(fields, [(last_id + 10, "Rice", 2.0, "pantry", 7)]), (1, 0))
+        self.assertEqual(Product.find(last_id + 10).name, "Rice")
+
+    def test_delete_where(self):
+        """It should Delete Products matching a filter in one statement"""
+        products = ProductFactory.create_batch(10)
+        Product.bulk_create(products)
+        category = products[0].category
+        count = len([product for product in products if product.category == category])
+        self.assertEqual(Product.delete_where(category=category), count)
+        self.assertEqual(len(Product.all()), 10 - count)
+        remaining = Product.all()
+        self.assertEqual(Product.delete_where([remaining[0].id]), 1)
+        self.assertEqual(len(Product.all()), 9 - count)
+
+    def test_increment_like(self):
+        """It should atomically add likes to a Product"""
+        product = ProductFactory(like=3)
+        product.create()
+        liked = Product.increment_like(product.id)
+        self.assertEqual(liked.id, product.id)
+        self.assertEqual(liked.like, 4)
+        liked = Product.increment_like(product.id, 5)
+        self.assertEqual(liked.like, 9)
+        self.assertEqual(Product.find(product.id).like, 9)
+        self.assertIsNone(Product.increment_like(0))
+
+    def test_increment_likes(self):
+        """It should add buffered likes to many Products at once"""
+        products = ProductFactory.create_batch(3, like=0)
+        Product.bulk_create(products)
+        Product.increment_likes({products[0].id: 2, products[2].id: 5})
+        self.assertEqual(Product.find(products[0].id).like, 2)
+        self.assertEqual(Product.find(products[1].id).like, 0)
+        self.assertEqual(Product.find(products[2].id).like, 5)
+
+    def test_version(self):
+        """It should bump the version of a Product on every change"""
+        product = ProductFactory()
+        product.create()
+        self.assertEqual(Product.find_version(product.id), 1)
+        product.price = 8
+        product.update()
+        self.assertEqual(Product.find_version(product.id), 2)
+        Product.increment_like(product.id)
+        self.assertEqual(Product.find_version(product.id), 3)
+        Product.increment_likes({product.id: 2})
+        self.assertEqual(Product.find_version(product.id), 4)
+        self.assertIsNone(Product.find_version(0))
+
+    def test_upgrade_schema(self):
+        """It should upgrade a product table created before versions and AUTOINCREMENT ids"""
+        db.session.remove()
+        db.drop_all()
+        # the table as the first release created it
+        old_table = Table(
+            "product", MetaData(),
+            Column("id", Integer, primary_key=True),
+            Column("name", String(63), nullable=False, index=True),
+            Column("desc", String(256)),
+            Column("price", Float, nullable=False, index=True),
+            Column("category", String(63), nullable=False, index=True),
+            Column("inventory", Integer, nullable=False),
+            Column("discount", Float, nullable=False),
+            Column("like", Integer, nullable=False, index=True),
+            Column("created_date", Date, nullable=False, index=True),
+            Column("modified_date", Date),
+            Column("deleted_date", Date),
+        )
+        old_table.create(db.engine)
+        with db.engine.begin() as connection:
+            connection.execute(old_table.insert(), [
+                {"name": name, "price": 1.0, "category": "dairy", "inventory": 1, "discount": 1.0, "like": 0,
+                 "created_date": date(2020, 1, 1)} for name in ("Milk", "Cheese")
+            ])
+        for _ in range(2):
+            with db.engine.begin() as connection:
+                upgrade_schema(connection)
+        self.assertEqual([(product.name, product.version) for product in Product.all()], [("Milk", 1), ("Cheese", 1)])
+        Product.delete_where([2])
+        product = ProductFactory(name="Butter")
+        product.create()
+        self.assertEqual(product.id, 3)
+        self.assertEqual([found.name for found in Product.search(q="milk")], ["Milk"])
+
+    def test_upgrade_schema_fulltext(self):
+        """It should add a missing full-text index to an existing product table"""
+        ProductFactory(name="Milk", desc="fresh").create()
+        with db.engine.begin() as connection:
+            if connection.dialect.name == "postgresql":
+                connection.exec_driver_sql("DROP INDEX ix_product_fulltext")
+            else:
+                connection.exec_driver_sql("DROP TABLE product_fts")
+                connection.exec_driver_sql("DROP TRIGGER IF EXISTS product_fts_insert")
+        with db.engine.begin() as connection:
+            upgrade_schema(connection)
+        ProductFactory(name="Bread", desc="fresh").create()
+        self.assertEqual(sorted(found.name for found in Product.search(q="fresh")), ["Bread", "Milk"])
+
+    def test_find_cached(self):
+        """It should serve repeated reads from the product cache"""
+        product = ProductFactory()
+        product.create()
+        data = Product.find_cached(product.id)
+        self.assertEqual(data["name"], product.name)
+        hits = product_cache.hits
+        self.assertEqual(Product.find_cached(product.id), data)
+        self.assertEqual(product_cache.hits, hits + 1)
+        self.assertIsNone(Product.find_cached(0))
+
+    def test_find_cached_invalidation(self):
+        """It should drop cached Products when they change"""
+        product = ProductFactory(like=0)
+        product.create()
+        Product.find_cached(product.id)
+        product.name = "Tomato"
+        product.update()
+        self.assertEqual(Product.find_cached(product.id)["name"], "Tomato")
+        Product.increment_like(product.id)
+        self.assertEqual(Product.find_cached(product.id)["like"], 1)
+        Product.find(product.id).delete()
+        self.assertIsNone(Product.find_cached(product.id))
+
+    def test_product_cache_lru_and_ttl(self):
+        """It should evict the least recently used and expired entries"""
+        cache = ProductCache(maxsize=2, ttl=60)
+        cache.put(1, {"id": 1})
+        cache.put(2, {"id": 2})
+        self.assertEqual(cache.get(1), {"id": 1})
+        cache.put(3, {"id": 3})
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.stats()["evictions"], 1)
+        cache.configure(maxsize=2, ttl=-1)
+        cache.put(1, {"id": 1})
+        self.assertIsNone(cache.get(1))
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["size"], 0)
+
+    def test_page(self):
+        """It should return Products one keyset page at a time"""
+        products = ProductFactory.create_batch(5)
+        for product in products:
+            product.create()
+        ids = sorted(product.id for product in products)
+        first = Product.page(None, 3)
+        self.assertEqual([product["id"] for product in first], ids[:3])
+        second = Product.page(first[-1]["id"], 3)
+        self.assertEqual([product["id"] for product in second], ids[3:])
+        category = products[0].category
+        found = Product.page(None, 10, category=category)
+        self.assertTrue(found)
+        for product in found:
+            self.assertEqual(product["category"], category)
+
+    def test_search(self):
+        """It should Find Products matching several criteria at once"""
+        products = ProductFactory.create_batch(10)
+        Product.bulk_create(products)
+        name = products[0].name
+        category = products[0].category
+        count = len([product for product in products if product.name == name and product.category == category])
+        found = Product.search(name=name, category=category, price=None)
+        self.assertEqual(found.count(), count)
+        for product in found:
+            self.assertEqual(product.name, name)
+            self.assertEqual(product.category, category)
+        self.assertEqual(Product.search().count(), 10)
+        self.assertRaises(DataValidationError, Product.search, desc="word")
+
+    def test_search_price_range_sorted(self):
+        """It should Find Products in a price range in sort order"""
+        products = ProductFactory.create_batch(10)
+        Product.bulk_create(products)
+        found = Product.search(min_price=20, max_price=50, sort="-price").all()
+        expected = sorted((p.price for p in products if 20 <= p.price <= 50), reverse=True)
+        self.assertEqual([product.price for product in found], expected)
+        self.assertRaises(DataValidationError, Product.search, sort="desc")
+
+    def test_page_sorted(self):
+        """It should page through Products sorted by like"""
+        products = ProductFactory.create_batch(6)
+        Product.bulk_create(products)
+        first = Product.page(None, 3, "-like")
+        second = Product.page(first[-1]["id"], 3, "-like", first[-1]["like"])
+        likes = [product["like"] for product in first + second]
+        self.assertEqual(likes, sorted((p.like for p in products), reverse=True))
+        self.assertEqual(len({product["id"] for product in first + second}), 6)
+
+    def test_page_fields(self):
+        """It should only select the requested fields plus the cursor and ETag columns"""
+        Product.bulk_create(ProductFactory.create_batch(3))
+        found = Product.page(None, 3, "-price", fields=["name"])
+        self.assertEqual(set(found[0]), {"name", "id", "version", "price"})
+        found = Product.search_rows(fields=["id", "created_date"])
+        self.assertEqual(found[0]["created_date"], "2008-01-01")
+        self.assertEqual(set(found[0]), {"id", "created_date"})
+        self.assertRaises(DataValidationError, Product.search_rows, fields=["secret"])
+
+    def test_search_full_text(self):
+        """It should Find Products by words in their name or description, best match first"""
+        Product.bulk_create([
+            ProductFactory(name="Milk", desc="fresh whole milk from the farm"),
+            ProductFactory(name="Cheese", desc="aged cheese"),
+            ProductFactory(name="Ice Cream", desc="vanilla made with milk"),
+            ProductFactory(name="Carrot", desc="crunchy"),
+        ])
+        found = Product.search(q="milk").all()
+        self.assertEqual([product.name for product in found][0], "Milk")
+        self.assertEqual(sorted(product.name for product in found), ["Ice Cream", "Milk"])
+        self.assertEqual(Product.search(q="vanilla milk").count(), 1)
+        self.assertEqual(Product.search(q='"AND milk').count(), 0)
+        self.assertEqual(Product.search(q="   ").count(), 0)
+        self.assertRaises(DataValidationError, Product.search, sort="rank")
+
+    def test_search_full_text_index_follows_changes(self):
+        """It should keep the full-text index in sync with updates and deletes"""
+        product = ProductFactory(name="Milk", desc="skimmed")
+        product.create()
+        self.assertEqual(Product.search(q="skimmed").count(), 1)
+        product.desc = "oat"
+        product.update()
+        self.assertEqual(Product.search(q="skimmed").count(), 0)
+        self.assertEqual(Product.search(q="oat").count(), 1)
+        product.delete()
+        self.assertEqual(Product.search(q="oat").count(), 0)
+
+    def test_suggest(self):
+        """It should suggest Product names from the name index"""
+        for name in ["Milk", "Milk", "milkshake", "Mint Tea", "Cheese"]:
+            ProductFactory(name=name).create()
+        self.assertEqual(Product.suggest("mil"), ["Milk", "milkshake"])
+        self.assertEqual(Product.suggest("M", 2), ["Milk", "milkshake"])
+        self.assertEqual(Product.suggest("x"), [])
+
+        # the index follows creates, renames and deletes
+        product = Product.search(name="Cheese").first()
+        product.name = "Milk Chocolate"
+        product.update()
+        self.assertEqual(Product.suggest("milk"), ["Milk", "Milk Chocolate", "milkshake"])
+        self.assertEqual(Product.suggest("che"), [])
+        product.delete()
+        Product.search(name="Milk").first().delete()
+        self.assertEqual(Product.suggest("milk"), ["Milk", "milkshake"])
+        Product.delete_where(name="Milk")
+        self.assertEqual(Product.suggest("milk"), ["milkshake"])
+
+    def test_suggest_bulk_writes(self):
+        """It should keep the name index current through bulk writes without rebuilding it"""
+        Product.bulk_load(["name", "price", "category", "inventory"], [
+            ("Milk", 1.0, "dairy", 1), ("Milk", 1.0, "dairy", 1), ("Mint Tea", 2.0, "beverage", 1),
+        ])
+        with patch.object(Product, "rebuild_name_index") as rebuild_name_index:
+            self.assertEqual(Product.suggest("m"), ["Milk", "Mint Tea"])
+            tea = Product.find_by_name("Mint Tea")[0]
+            fields = ["id", "name", "price", "category", "inventory"]
+            Product.bulk_upsert(fields, [(tea.id, "Green Tea", 2.0, "beverage", 1), (None, "Mango", 3.0, "produce", 1)])
+            self.assertEqual(Product.suggest("m"), ["Mango", "Milk"])
+            self.assertEqual(Product.suggest("g"), ["Green Tea"])
+            milk = Product.find_by_name("Milk").all()
+            Product.delete_where([milk[0].id])
+            self.assertEqual(Product.suggest("mi"), ["Milk"])
+            Product.delete_where([milk[1].id, tea.id])
+            self.assertEqual(Product.suggest("m"), ["Mango"])
+            self.assertEqual(Product.suggest("g"), [])
+            rebuild_name_index.assert_not_called()
+        Product.delete_where()
+        self.assertEqual(Product.suggest("m"), [])
+
+    def test_suggest_stale_index(self):
+        """It should serve a stale name index while it is rebuilt in the background"""
+        ProductFactory(name="Milk").create()
+        self.assertEqual(Product.suggest("m"), ["Milk"])
+        # a write from another worker bypasses the index
+        db.session.execute(Product.__table__.insert().values(
+            name="Mango", price=1.0, category="produce", inventory=1, discount=1, like=0,
+            created_date=date.today(), version=1,
+        ))
+        db.session.commit()
+        product_names.invalidate()
+        refreshed = threading.Event()
+        rebuild_name_index = Product.rebuild_name_index.__func__
+
+        def rebuild(cls):
+            refreshed.wait(5)
+            rebuild_name_index(cls)
+
+        with patch.object(Product, "rebuild_name_index", classmethod(rebuild)):
+            self.assertEqual(Product.suggest("m"), ["Milk"])
+            self.assertEqual(Product.suggest("m"), ["Milk"])
+            self.assertFalse(product_names.start_refresh())
+            refreshed.set()
+            for _ in range(50):
+                if not product_names.is_stale():
+                    break
+                time.sleep(0.1)
+        self.assertEqual(Product.suggest("m"), ["Mango", "Milk"])
+
+    def test_name_index(self):
+        """It should count Products per name in the name index"""
+        index = NameIndex()
+        self.assertTrue(index.is_stale())
+        index.rebuild([("Tea", 2)])
+        self.assertFalse(index.is_stale())
+        index.remove("Tea")
+        self.assertEqual(index.suggest("t", 10), ["Tea"])
+        index.remove("Tea")
+        self.assertEqual(index.suggest("t", 10), [])
+        index.remove("Coffee")
+        index.update(added=[("Tea", 1), ("Coffee", 2)])
+        index.update(removed=[("Tea", 1)])
+        self.assertEqual(index.suggest("", 10), ["Coffee"])
+        index.remove("Coffee", 2)
+        self.assertEqual(index.suggest("", 10), [])
+        index.invalidate()
+        self.assertTrue(index.is_stale())
+        self.assertTrue(index.is_built())
+        self.assertTrue(index.start_refresh())
+        self.assertFalse(index.start_refresh())
+        index.end_refresh()
+        self.assertTrue(index.start_refresh())
+
+    def test_init_db_leaves_no_context(self):
+        """It should not leave an app context pushed for requests to share"""
+        contexts = []
+
+        def initialize():
+            Product.init_db(app)
+            contexts.append(has_app_context())
+
+        thread = threading.Thread(target=initialize)
+        thread.start()
+        thread.join()
+        self.assertEqual(contexts, [False])
+
+    def test_failed_commit_rolls_back(self):
+        """It should leave the session usable after a failed commit"""
+        product = ProductFactory()
+        product.create()
+        invalid = ProductFactory(name=None)
+        self.assertRaises(Exception, invalid.create)
+        self.assertFalse(db.session.new)
+        self.assertEqual(Product.find(product.id).name, product.name)
+
+    def test_rollback_session(self):
+        """It should roll back the session of a failed request only"""
+        product = ProductFactory()
+        db.session.add(product)
+        rollback_session(None)
+        self.assertIn(product, db.session)
+        rollback_session(RuntimeError("request failed"))
+        self.assertNotIn(product, db.session)
+        self.assertEqual(len(Product.all()), 0)
+
     def _test_find_or_404_found(self):
         """It should Find or return 404 not found"""
         products = ProductFactory.create_batch(3)
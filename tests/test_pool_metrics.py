@@ -0,0 +1,71 @@
+"""
+Test cases for the instrumented connection pool
+"""
+import os
+import tempfile
+from unittest import TestCase
+from sqlalchemy import create_engine, exc
+from service.common.pool_metrics import InstrumentedQueuePool, PoolMetrics
+
+
+class TestPoolMetrics(TestCase):
+    """Pool Metrics Tests"""
+
+    def setUp(self):
+        self.metrics = PoolMetrics()
+        handle, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.engine = create_engine(
+            f"sqlite:///{self.path}",
+            poolclass=InstrumentedQueuePool,
+            pool_size=1,
+            max_overflow=1,
+            pool_timeout=0.05,
+        )
+        self.engine.pool.metrics = self.metrics
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def test_checkout(self):
+        """It should count checkouts and report the pool gauges"""
+        with self.engine.connect():
+            stats = self.metrics.stats(self.engine.pool)
+            self.assertEqual(stats["checked_out"], 1)
+        stats = self.metrics.stats(self.engine.pool)
+        self.assertEqual(stats["checkouts"], 1)
+        self.assertEqual(stats["overflows"], 0)
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertEqual(stats["size"], 1)
+        self.assertGreaterEqual(stats["wait_ms_max"], 0)
+
+    def test_overflow_and_timeout(self):
+        """It should count overflow checkouts and timeouts"""
+        with self.engine.connect(), self.engine.connect():
+            self.assertRaises(exc.TimeoutError, self.engine.connect)
+        stats = self.metrics.stats(self.engine.pool)
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertEqual(stats["overflows"], 1)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertGreaterEqual(stats["wait_ms_max"], 50)
+
+    def test_overflow_reuse(self):
+        """It should only count checkouts that open an overflow connection"""
+        first = self.engine.connect()
+        with self.engine.connect():
+            first.close()
+            # the idle pooled connection is reused while the overflow one is still open
+            with self.engine.connect():
+                stats = self.metrics.stats(self.engine.pool)
+                self.assertEqual(stats["overflow"], 1)
+        stats = self.metrics.stats(self.engine.pool)
+        self.assertEqual(stats["checkouts"], 3)
+        self.assertEqual(stats["overflows"], 1)
+
+    def test_reset(self):
+        """It should reset the counters"""
+        self.metrics.record_checkout(0.5, True)
+        self.metrics.reset()
+        self.assertEqual(self.metrics.stats()["checkouts"], 0)
+        self.assertNotIn("size", self.metrics.stats())
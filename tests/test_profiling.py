@@ -0,0 +1,101 @@
+"""
+Test cases for the request profiling middleware
+"""
+import os
+import pstats
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from flask import Flask
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+from service.common.profiling import ProfilerMiddleware, init_profiling
+
+
+def hello_app(environ, start_response):
+    """A WSGI app that streams its body in two chunks"""
+    response = Response(iter([b"hello ", b"world"]))
+    return response(environ, start_response)
+
+
+class TestProfiling(TestCase):
+    """Profiling Middleware Tests"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.directory = os.path.join(self.tmp.name, "profiles")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def profiles(self) -> list:
+        """Returns the profile files written so far"""
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(".prof"))
+
+    def test_disabled(self):
+        """It should not install the middleware when profiling is off"""
+        app = Flask(__name__)
+        app.config.update(PROFILE_TOKEN=None, PROFILE_SAMPLE_RATE=0.0, PROFILE_DIR=self.directory)
+        init_profiling(app)
+        self.assertNotIsInstance(app.wsgi_app, ProfilerMiddleware)
+        app.config.update(PROFILE_TOKEN="s3cr3t")
+        init_profiling(app)
+        self.assertIsInstance(app.wsgi_app, ProfilerMiddleware)
+
+    def test_trusted_header(self):
+        """It should profile requests carrying the token"""
+        client = Client(ProfilerMiddleware(hello_app, self.directory, token="s3cr3t"))
+        with client.get("/api/products", headers={"X-Profile": "wr\u00f6ng"}) as response:
+            self.assertNotIn("X-Profile-Id", response.headers)
+        self.assertEqual(self.profiles(), [])
+
+        with client.get("/api/products", headers={"X-Profile": "s3cr3t"}) as response:
+            self.assertEqual(response.get_data(), b"hello world")
+        profile_id = response.headers["X-Profile-Id"]
+        self.assertTrue(profile_id.endswith(".GET.api_products"))
+        files = self.profiles()
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].startswith(profile_id))
+        stats = pstats.Stats(os.path.join(self.directory, files[0]))
+        self.assertTrue(any(func[2] == "hello_app" for func in stats.stats))
+
+    def test_sampling(self):
+        """It should profile a random fraction of requests without announcing it"""
+        client = Client(ProfilerMiddleware(hello_app, self.directory, sample_rate=0.5))
+        with patch("service.common.profiling.random.random", side_effect=[0.9, 0.1]):
+            client.get("/").close()
+            self.assertEqual(self.profiles(), [])
+            response = client.get("/")
+            response.close()
+        self.assertNotIn("X-Profile-Id", response.headers)
+        self.assertEqual(len(self.profiles()), 1)
+        self.assertIn(".GET.root.", self.profiles()[0])
+
+    def test_max_files(self):
+        """It should keep only the newest profiles"""
+        client = Client(ProfilerMiddleware(hello_app, self.directory, sample_rate=1.0, max_files=2))
+        for _ in range(4):
+            client.get("/").close()
+        self.assertEqual(len(self.profiles()), 2)
+
+    def test_streamed_body(self):
+        """It should pass a streamed body through chunk by chunk and profile it when closed"""
+        produced = []
+
+        def stream_app(environ, start_response):
+            start_response("200 OK", [("Content-Type", "application/x-ndjson")])
+            for number in range(3):
+                produced.append(number)
+                yield b"%d\n" % number
+
+        app = ProfilerMiddleware(stream_app, self.directory, sample_rate=1.0)
+        body = app({"REQUEST_METHOD": "GET", "PATH_INFO": "/"}, lambda status, headers, exc_info=None: None)
+        chunks = iter(body)
+        self.assertEqual(next(chunks), b"0\n")
+        # nothing is produced ahead of the server
+        self.assertEqual(produced, [0])
+        self.assertEqual(self.profiles(), [])
+        self.assertEqual(list(chunks), [b"1\n", b"2\n"])
+        body.close()
+        stats = pstats.Stats(os.path.join(self.directory, self.profiles()[0]))
+        self.assertTrue(any(func[2] == "stream_app" for func in stats.stats))
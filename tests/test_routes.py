@@ -6,13 +6,19 @@ Test cases can be run with the following:
   coverage report -m
 """
 import os
+import base64
+import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
+from unittest.mock import patch
 
 # from unittest.mock import MagicMock, patch
 from service import app
-from service.models import db, init_db, Product
-from service.common import status  # HTTP Status Codes
+from service.models import db, init_db, Product, product_cache, product_names
+from service.common import metrics, status  # HTTP Status Codes
+from service.routes import like_buffer
 from tests.factories import ProductFactory
 
 DATABASE_URI = os.getenv(
@@ -43,17 +49,23 @@ class TestProductsServer(TestCase):
     @classmethod
     def tearDownClass(cls):
         """This runs once after the entire test suite"""
-        db.session.close()
+        with app.app_context():
+            db.session.close()
 
     def setUp(self):
         """This runs before each test"""
+        self.app_context = app.app_context()
+        self.app_context.push()
         self.client = app.test_client()
         db.session.query(Product).delete()  # clean up the last tests
         db.session.commit()
+        product_cache.clear()
+        product_names.rebuild([])
 
     def tearDown(self):
         """This runs after each test"""
         db.session.remove()
+        self.app_context.pop()
 
     def _create_products(self, count):
         """Factory method to create products in bulk"""
@@ -89,6 +101,44 @@ class TestProductsServer(TestCase):
         data = response.get_json()
         self.assertEqual(data["name"], test_product.name)
 
+    def test_get_product_not_modified(self):
+        """It should return 304 when the Product ETag still matches"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        etag = response.headers.get("ETag")
+        self.assertIsNotNone(etag)
+        response = self.client.get(f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.get_data(), b"")
+
+        # the cached Product answers without a version lookup, a miss falls back to one
+        with patch.object(Product, "find_version", wraps=Product.find_version) as find_version:
+            response = self.client.get(f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            find_version.assert_not_called()
+            product_cache.clear()
+            response = self.client.get(f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            find_version.assert_called_once()
+
+        # a like changes the version, so the old ETag no longer matches
+        self.client.put(f"{BASE_URL}/{test_product.id}/like")
+        response = self.client.get(f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers.get("ETag"), etag)
+
+    def test_get_product_fields(self):
+        """It should Get only the requested fields of a Product"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}?fields=id,name,price")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), {"id": test_product.id, "name": test_product.name,
+                                               "price": test_product.price})
+        full = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertNotEqual(response.headers["ETag"], full.headers["ETag"])
+        response = self.client.get(f"{BASE_URL}/{test_product.id}?fields=id,password")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_get_product_not_found(self):
         """It should not Get a Product thats not found"""
         response = self.client.get(f"{BASE_URL}/0")
@@ -215,6 +265,17 @@ class TestProductsServer(TestCase):
         self.assertEqual(updated_product["price"], new_product["price"])
         self.assertEqual(updated_product["category"], "vegetable")
 
+    def test_get_product_after_update(self):
+        """It should not serve a stale Product after it is updated"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        new_product = response.get_json()
+        new_product["name"] = "Tomato"
+        response = self.client.put(f"{BASE_URL}/{test_product.id}", json=new_product)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(response.get_json()["name"], "Tomato")
+
     def test_update_product_not_found(self):
         """It should not Update a Product thats not found"""
         test_product = ProductFactory()
@@ -264,6 +325,36 @@ class TestProductsServer(TestCase):
             response = self.client.delete(f"{BASE_URL}/{test_product.id}")
             self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_delete_products_by_category(self):
+        """It should delete every Product in a category"""
+        products = self._create_products(6)
+        category = products[0].category
+        count = len([product for product in products if product.category == category])
+        response = self.client.delete(f"{BASE_URL}?category={category}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["deleted"], count)
+        response = self.client.get(BASE_URL)
+        self.assertEqual(len(response.get_json()), len(products) - count)
+
+    def test_delete_products_by_ids(self):
+        """It should delete the Products with the given ids"""
+        products = self._create_products(4)
+        response = self.client.delete(f"{BASE_URL}?id={products[0].id}&id={products[1].id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["deleted"], 2)
+        response = self.client.get(BASE_URL)
+        self.assertEqual(sorted(item["id"] for item in response.get_json()),
+                         sorted([products[2].id, products[3].id]))
+
+    def test_delete_all_products(self):
+        """It should delete every Product only when all=true"""
+        self._create_products(3)
+        response = self.client.delete(BASE_URL)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.delete(f"{BASE_URL}?all=true")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["deleted"], 3)
+
     def test_list_products(self):
         """This should list all products"""
         products = self._create_products(5)
@@ -271,6 +362,67 @@ class TestProductsServer(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.get_json()), len(products))
 
+    def test_list_products_not_modified(self):
+        """It should return 304 when the list ETag still matches"""
+        products = self._create_products(3)
+        response = self.client.get(BASE_URL)
+        etag = response.headers.get("ETag")
+        self.assertIsNotNone(etag)
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # a different query has a different ETag
+        response = self.client.get(f"{BASE_URL}?limit=2", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # an update changes the ETag of the list
+        new_product = products[0].serialize()
+        new_product["name"] = "Tomato"
+        self.client.put(f"{BASE_URL}/{products[0].id}", json=new_product)
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_etags_after_delete(self):
+        """It should not revalidate old ETags against a Product created after a delete"""
+        products = self._create_products(3)
+        response = self.client.get(BASE_URL)
+        list_tag = response.headers["ETag"]
+        response = self.client.get(f"{BASE_URL}/{products[2].id}")
+        product_tag = response.headers["ETag"]
+        self.client.delete(f"{BASE_URL}/{products[2].id}")
+        self.client.post(BASE_URL, json=ProductFactory().serialize())
+        response = self.client.get(BASE_URL, headers={"If-None-Match": list_tag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(f"{BASE_URL}/{products[2].id}", headers={"If-None-Match": product_tag})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_page_not_modified(self):
+        """It should build the ETag of a page from its own rows"""
+        products = self._create_products(4)
+        response = self.client.get(f"{BASE_URL}?limit=2&fields=name")
+        etag = response.headers["ETag"]
+        self.assertNotIn("version", response.get_json()["items"][0])
+        response = self.client.get(f"{BASE_URL}?limit=2&fields=name", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # a change past the end of the page leaves its ETag alone
+        Product.increment_like(products[3].id)
+        response = self.client.get(f"{BASE_URL}?limit=2&fields=name", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Product.increment_like(products[0].id)
+        response = self.client.get(f"{BASE_URL}?limit=2&fields=name", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()["items"]), 2)
+
+    def test_list_fields_without_version(self):
+        """It should not return the columns the ETag is built from unless asked to"""
+        self._create_products(2)
+        response = self.client.get(f"{BASE_URL}?fields=name")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([list(product) for product in response.get_json()], [["name"], ["name"]])
+
     def test_list_products_with_name(self):
         """List all the products with a particular name"""
         products = self._create_products(5)
@@ -307,6 +459,218 @@ class TestProductsServer(TestCase):
         for product in response_data:
             self.assertEqual(product["price"], price)
 
+    def test_list_products_paginated(self):
+        """It should walk all Products page by page with a cursor"""
+        products = self._create_products(5)
+        response = self.client.get(f"{BASE_URL}?limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data["items"]), 2)
+        self.assertIsNotNone(data["next"])
+        self.assertIn('rel="next"', response.headers.get("Link"))
+
+        seen = [item["id"] for item in data["items"]]
+        while data["next"]:
+            response = self.client.get(f"{BASE_URL}?limit=2&next={data['next']}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.get_json()
+            seen.extend(item["id"] for item in data["items"])
+        self.assertIsNone(response.headers.get("Link"))
+        self.assertEqual(seen, sorted(product.id for product in products))
+
+    def test_list_products_paginated_with_category(self):
+        """It should apply filters to every page"""
+        products = self._create_products(6)
+        category = products[0].category
+        count = len([product for product in products if product.category == category])
+        response = self.client.get(f"{BASE_URL}?category={category}&limit=10")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data["items"]), count)
+        self.assertIsNone(data["next"])
+        for product in data["items"]:
+            self.assertEqual(product["category"], category)
+
+    def test_list_products_bad_page_args(self):
+        """It should not list Products with a bad limit or cursor"""
+        response = self.client.get(f"{BASE_URL}?limit=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}?next=not-a-cursor")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # well formed cursors whose value does not fit the sort column
+        for sort, value in (("created_date", "nope"), ("created_date", 5), ("price", "cheap"),
+                            ("like", 1.5), ("-like", True), ("id", None)):
+            position = json.dumps({"id": 1, "sort": sort, "value": value}).encode("utf-8")
+            cursor = base64.urlsafe_b64encode(position).decode("ascii").rstrip("=")
+            response = self.client.get(f"{BASE_URL}?sort={sort}&next={cursor}")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, sort)
+            self.assertIn("Invalid pagination cursor.", response.get_json()["message"])
+
+    def test_list_products_ndjson(self):
+        """It should stream all Products as newline delimited JSON"""
+        products = self._create_products(5)
+        response = self.client.get(BASE_URL, headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), len(products))
+        ids = [json.loads(line)["id"] for line in lines]
+        self.assertEqual(ids, sorted(product.id for product in products))
+
+        # an invalid query is rejected before the stream starts
+        response = self.client.get(f"{BASE_URL}?sort=rank", headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_suggest_products(self):
+        """It should suggest Product names starting with a prefix"""
+        products = self._create_products(5)
+        names = sorted({product.name for product in products if product.name.lower().startswith("m")})
+        response = self.client.get(f"{BASE_URL}/suggest?prefix=m")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), names)
+        response = self.client.get(f"{BASE_URL}/suggest?prefix=m&limit=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}/suggest")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_products_batch(self):
+        """It should Create a batch of Products in one request"""
+        test_products = ProductFactory.create_batch(5)
+        response = self.client.post(f"{BASE_URL}/batch", json=[product.serialize() for product in test_products])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.get_json()
+        self.assertEqual(len(data), len(test_products))
+        for new_product, test_product in zip(data, test_products):
+            self.assertIsNotNone(new_product["id"])
+            self.assertEqual(new_product["name"], test_product.name)
+        response = self.client.get(BASE_URL)
+        self.assertEqual(len(response.get_json()), len(test_products))
+
+    def test_create_products_batch_invalid(self):
+        """It should not Create any Product in a batch with invalid data"""
+        test_products = [product.serialize() for product in ProductFactory.create_batch(3)]
+        test_products[1]["price"] = -1
+        response = self.client.post(f"{BASE_URL}/batch", json=test_products)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        data = response.get_json()
+        self.assertEqual(len(data["errors"]), 1)
+        self.assertEqual(data["errors"][0]["index"], 1)
+        response = self.client.get(BASE_URL)
+        self.assertEqual(response.get_json(), [])
+
+    def test_create_products_batch_not_a_list(self):
+        """It should not Create a batch that is not an array"""
+        response = self.client.post(f"{BASE_URL}/batch", json=ProductFactory().serialize())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_products_with_category_and_price(self):
+        """It should combine the category and price filters"""
+        products = self._create_products(6)
+        category = products[0].category
+        price = products[0].price
+        count = len([product for product in products if product.category == category and product.price == price])
+        response = self.client.get(f"{BASE_URL}?category={category}&price={price}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response_data = response.get_json()
+        self.assertEqual(len(response_data), count)
+        for product in response_data:
+            self.assertEqual(product["category"], category)
+            self.assertEqual(product["price"], price)
+
+    def test_list_products_price_range_sorted(self):
+        """It should list Products in a price range sorted by price"""
+        products = self._create_products(8)
+        prices = sorted(product.price for product in products)
+        min_price, max_price = prices[2], prices[5]
+        response = self.client.get(f"{BASE_URL}?min_price={min_price}&max_price={max_price}&sort=-price")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([product["price"] for product in data], prices[2:6][::-1])
+
+    def test_list_products_sorted_pages(self):
+        """It should walk sorted pages without skipping or repeating Products"""
+        products = self._create_products(7)
+        for sort in ("like", "-like", "price", "created_date"):
+            seen = []
+            url = f"{BASE_URL}?sort={sort}&limit=3"
+            data = {"next": None}
+            while True:
+                response = self.client.get(url + (f"&next={data['next']}" if data["next"] else ""))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                data = response.get_json()
+                seen.extend(data["items"])
+                if not data["next"]:
+                    break
+            self.assertEqual(sorted(item["id"] for item in seen), sorted(product.id for product in products))
+            field = sort.lstrip("-")
+            values = [item[field] for item in seen]
+            self.assertEqual(values, sorted(values, reverse=sort.startswith("-")))
+
+    def test_list_products_bad_sort(self):
+        """It should not list Products with an unknown sort or a cursor for another sort"""
+        response = self.client.get(f"{BASE_URL}?sort=desc")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self._create_products(3)
+        response = self.client.get(f"{BASE_URL}?sort=price&limit=1")
+        cursor = response.get_json()["next"]
+        response = self.client.get(f"{BASE_URL}?sort=like&limit=1&next={cursor}")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_products_full_text(self):
+        """It should list the Products matching a full-text query in ranked pages"""
+        test_products = ProductFactory.create_batch(5, desc="organic")
+        test_products[0].desc = "organic organic"
+        response = self.client.post(f"{BASE_URL}/batch", json=[product.serialize() for product in test_products])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self._create_products(2)
+
+        response = self.client.get(f"{BASE_URL}?q=organic")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data[0]["desc"], "organic organic")
+
+        seen = []
+        response = self.client.get(f"{BASE_URL}?q=organic&limit=2")
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            page = response.get_json()
+            seen.extend(item["id"] for item in page["items"])
+            if not page["next"]:
+                break
+            response = self.client.get(f"{BASE_URL}?q=organic&limit=2&next={page['next']}")
+        self.assertEqual(seen, [item["id"] for item in data])
+
+    def test_list_products_fields(self):
+        """It should list only the requested fields of the Products"""
+        self._create_products(3)
+        response = self.client.get(f"{BASE_URL}?fields=id,name")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for product in response.get_json():
+            self.assertEqual(set(product), {"id", "name"})
+
+        response = self.client.get(f"{BASE_URL}?fields=name&sort=price&limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(set(data["items"][0]), {"name"})
+        self.assertIn("fields=name", response.headers["Link"])
+        response = self.client.get(f"{BASE_URL}?fields=name&sort=price&limit=2&next={data['next']}")
+        self.assertEqual(len(response.get_json()["items"]), 1)
+
+        response = self.client.get(BASE_URL, query_string={"fields": "desc"},
+                                   headers={"Accept": "application/x-ndjson"})
+        for line in response.get_data(as_text=True).splitlines():
+            self.assertEqual(set(json.loads(line)), {"desc"})
+        response = self.client.get(f"{BASE_URL}?fields=")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(f"{BASE_URL}?fields=,")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_products_bad_price(self):
+        """It should not list Products with a price that is not a number"""
+        response = self.client.get(f"{BASE_URL}?price=cheap")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_method_not_allowed(self):
         """It should not allow an illegal method call"""
         test_product = ProductFactory()
@@ -348,6 +712,23 @@ class TestProductsServer(TestCase):
         logging.debug("Response data = %s", data)
         self.assertEqual(data["like"], prev_like_count + 2)
 
+    def test_like_product_buffered(self):
+        """It should buffer likes and write them behind"""
+        test_product = self._create_products(1)[0]
+        app.config["LIKE_BUFFER_ENABLED"] = True
+        try:
+            for count in range(1, 4):
+                response = self.client.put(f"{BASE_URL}/{test_product.id}/like")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.get_json()["like"], test_product.like + count)
+            response = self.client.put(f"{BASE_URL}/0/like")
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        finally:
+            app.config["LIKE_BUFFER_ENABLED"] = False
+            like_buffer.stop()
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(response.get_json()["like"], test_product.like + 3)
+
     def test_like_product_not_found(self):
         """It should not Like a Product thats not found"""
         test_product = ProductFactory()
@@ -395,6 +776,99 @@ class TestProductsServer(TestCase):
         data = response.get_json()
         self.assertEqual(data["status"], "OK")
 
+    def test_concurrent_requests(self):
+        """It should give every request its own session when many threads share the app"""
+        threads, rounds = 12, 15
+        products = Product.bulk_create([ProductFactory() for _ in range(threads)])
+        payloads = [product.serialize() for product in products]
+        sessions = []
+        find = Product.find
+
+        def recording_find(product_id):
+            sessions.append((threading.get_ident(), db.session()))
+            return find(product_id)
+
+        def hammer(payload):
+            client = app.test_client()
+            for i in range(rounds):
+                data = dict(payload, name=f"{payload['name']}-{i}", inventory=i)
+                response = client.put(f"{BASE_URL}/{payload['id']}", json=data)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                response = client.get(f"{BASE_URL}/{payload['id']}")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.get_json()["name"], data["name"])
+                self.assertEqual(response.get_json()["inventory"], i)
+            return threading.get_ident()
+
+        with patch.object(Product, "find", side_effect=recording_find):
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                idents = set(executor.map(hammer, payloads))
+
+        # every request looks its Product up once, each time in a session of its own
+        self.assertEqual(len(idents), threads)
+        self.assertGreaterEqual(len(sessions), threads * rounds)
+        self.assertEqual(len({id(session) for _, session in sessions}), len(sessions))
+        self.assertNotIn(db.session(), [session for _, session in sessions])
+        db.session.expire_all()  # this test's own session still holds the Products it created
+        for payload in payloads:
+            self.assertEqual(Product.find(payload["id"]).name, f"{payload['name']}-{rounds - 1}")
+
+    def test_metrics(self):
+        """It should expose request and database metrics to Prometheus"""
+        test_product = self._create_products(1)[0]
+        self.client.get(f"{BASE_URL}/{test_product.id}")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        body = response.get_data(as_text=True)
+        self.assertIn('products_http_requests_total{method="GET",resource="product_resource",status="200"}', body)
+        self.assertIn('products_http_request_duration_seconds_bucket{le="0.1",method="POST",resource="product_collection"}',
+                      body)
+        self.assertIn('products_db_queries_total{statement="INSERT"}', body)
+        self.assertIn('products_db_query_duration_seconds_count{statement="SELECT"}', body)
+
+    def test_server_timing(self):
+        """It should report the queries and database time of a request"""
+        test_product = self._create_products(1)[0]
+        data = dict(test_product.serialize(), name="Renamed")
+        response = self.client.put(f"{BASE_URL}/{test_product.id}", json=data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response.headers["Server-Timing"]
+        # PUT looks the Product up, then updates and reloads it
+        self.assertRegex(timing, r'^db;dur=[0-9.]+;desc="3 queries", app;dur=[0-9.]+, total;dur=[0-9.]+$')
+        with patch.dict(metrics.settings, server_timing=False):
+            response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.assertNotIn("Server-Timing", response.headers)
+
+    def test_slow_query_log(self):
+        """It should log statements slower than the threshold as JSON"""
+        test_product = self._create_products(1)[0]
+        with patch.dict(metrics.settings, slow_query_seconds=0):
+            with self.assertLogs("flask.app", level="WARNING") as logs:
+                self.client.get(f"{BASE_URL}/{test_product.id}")
+        entries = [json.loads(line.split(":", 2)[2]) for line in logs.output if "slow_query" in line]
+        self.assertEqual(len(entries), 1)
+        self.assertTrue(entries[0]["statement"].startswith("SELECT"))
+        self.assertIn(str(test_product.id), entries[0]["parameters"])
+        self.assertEqual(entries[0]["path"], f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(entries[0]["resource"], "product_resource")
+
+    def test_stats(self):
+        """It should report the product cache counters"""
+        test_product = self._create_products(1)[0]
+        before = self.client.get("/stats").get_json()["product_cache"]
+        self.client.get(f"{BASE_URL}/{test_product.id}")
+        self.client.get(f"{BASE_URL}/{test_product.id}")
+        response = self.client.get("/stats")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        # the first read misses once and fills the cache, the second one hits
+        self.assertEqual(data["product_cache"]["misses"] - before["misses"], 1)
+        self.assertEqual(data["product_cache"]["hits"] - before["hits"], 1)
+        self.assertEqual(data["product_cache"]["size"], 1)
+        self.assertGreaterEqual(data["pool"]["checkouts"], 1)
+        self.assertIn("checked_out", data["pool"])
+
     ######################################################################
     # QUERY PRODUCTS
     ######################################################################